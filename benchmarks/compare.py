@@ -0,0 +1,37 @@
+"""
+compare two benchmark results written by benchmarks/run.py.
+
+usage:      python benchmarks/compare.py before.json after.json
+"""
+
+import argparse
+import json
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("before", type=str)
+    parser.add_argument("after", type=str)
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"before: {before['meta']['commit']}")
+    print(f"after:  {after['meta']['commit']}")
+    print()
+    print(f"{'benchmark':<28} {'before [s]':>12} {'after [s]':>12} {'ratio':>8}")
+    for name, result in after["results"].items():
+        if name not in before["results"]:
+            print(f"{name:<28} {'-':>12} {result['median']:>12.4f} {'-':>8}")
+            continue
+        old = before["results"][name]["median"]
+        new = result["median"]
+        ratio = new / old if old else float("inf")
+        print(f"{name:<28} {old:>12.4f} {new:>12.4f} {ratio:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+generate a synthetic output directory for benchmarking db-tools.
+
+every run gets a <fileroot>_info.npz (or _info.json) with `n_keys` inputs
+taken from the default dbtools.inputs.json, so the generated trees can be
+searched with the regular command line filters. optionally, runs also get a
+<fileroot>_samples.npz like grid-tdhf writes. with --shard-levels, runs are
+spread over hashed subdirectories like output/3f/a2/<fileroot>_info.npz.
+
+usage:      python benchmarks/generate.py output --runs 10000 --keys 12 --samples 1000
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from db_tools.config import load_input_keys
+
+# values are drawn from small pools, so searches have realistic selectivity
+POOL_SIZE = 16
+STR_VALUES = [f"value{i}" for i in range(POOL_SIZE)]
+
+
+def input_keys(n_keys):
+    keys = list(load_input_keys().items())
+    if n_keys > len(keys):
+        raise ValueError(f"At most {len(keys)} input keys are available")
+    return keys[:n_keys]
+
+
+def make_inputs(keys, rng):
+    inputs = {}
+    for key, typestr in keys:
+        i = int(rng.integers(POOL_SIZE))
+        if typestr == "int":
+            inputs[key] = 10 * (i + 1)
+        elif typestr == "float":
+            inputs[key] = round(0.01 * (i + 1), 4)
+        elif typestr == "bool":
+            inputs[key] = bool(i % 2)
+        else:
+            inputs[key] = STR_VALUES[i]
+    return inputs
+
+
+def shard_dir(output_dir, fileroot, shard_levels):
+    digest = hashlib.sha1(fileroot.encode()).hexdigest()
+    return os.path.join(
+        output_dir, *(digest[2 * i : 2 * i + 2] for i in range(shard_levels))
+    )
+
+
+def write_run(output_dir, index, keys, file_format, n_samples, seed, shard_levels=0):
+    rng = np.random.default_rng((seed, index))
+    fileroot = f"run{index:07d}"
+    if shard_levels:
+        output_dir = shard_dir(output_dir, fileroot, shard_levels)
+        os.makedirs(output_dir, exist_ok=True)
+    inputs = make_inputs(keys, rng)
+
+    if file_format == "json":
+        with open(os.path.join(output_dir, f"{fileroot}_info.json"), "w") as f:
+            json.dump({"inputs": inputs, "metadata": {"version": 1}}, f)
+    else:
+        np.savez(
+            os.path.join(output_dir, f"{fileroot}_info.npz"),
+            inputs=inputs,
+            metadata={"version": 1},
+        )
+
+    if n_samples:
+        n = int(rng.integers(n_samples // 2, n_samples + 1))
+        time_points = np.linspace(0, 1, n)
+        np.savez(
+            os.path.join(output_dir, f"{fileroot}_samples.npz"),
+            time_points=time_points,
+            expec_z=np.exp(1j * time_points)[:, None],
+        )
+
+
+def write_runs(output_dir, indices, keys, file_format, n_samples, seed, shard_levels):
+    for index in indices:
+        write_run(output_dir, index, keys, file_format, n_samples, seed, shard_levels)
+
+
+def generate_tree(
+    output_dir,
+    n_runs,
+    n_keys=12,
+    file_format="npz",
+    n_samples=0,
+    seed=0,
+    jobs=1,
+    shard_levels=0,
+):
+    """write n_runs synthetic runs to output_dir and return their input keys"""
+    os.makedirs(output_dir, exist_ok=True)
+    keys = input_keys(n_keys)
+    write = partial(
+        write_runs,
+        output_dir,
+        keys=keys,
+        file_format=file_format,
+        n_samples=n_samples,
+        seed=seed,
+        shard_levels=shard_levels,
+    )
+
+    chunks = [
+        range(start, min(start + 1000, n_runs)) for start in range(0, n_runs, 1000)
+    ]
+    if jobs == 1:
+        for chunk in chunks:
+            write(chunk)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(write, chunks))
+
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("output_dir", type=str)
+    parser.add_argument("--runs", type=int, default=10000)
+    parser.add_argument("--keys", type=int, default=12, help="Number of input keys")
+    parser.add_argument("--format", choices=["npz", "json"], default="npz")
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=0,
+        help="Write _samples.npz files with up to this many time points",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--shard-levels",
+        type=int,
+        default=0,
+        help="Spread the runs over this many levels of hashed subdirectories",
+    )
+    args = parser.parse_args()
+
+    generate_tree(
+        args.output_dir,
+        args.runs,
+        n_keys=args.keys,
+        file_format=args.format,
+        n_samples=args.samples,
+        seed=args.seed,
+        jobs=args.jobs,
+        shard_levels=args.shard_levels,
+    )
+
+
+if __name__ == "__main__":
+    main()
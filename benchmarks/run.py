@@ -0,0 +1,255 @@
+"""
+time the main db-tools code paths on a synthetic output directory.
+
+the results are written as JSON, which can be compared across commits with
+benchmarks/compare.py.
+
+usage:      python benchmarks/run.py --runs 10000 --output results.json
+            python benchmarks/run.py --prefix existing_output --keys 12
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from generate import generate_tree, input_keys, POOL_SIZE, STR_VALUES
+
+from db_tools.filters import Range
+from db_tools.main import update
+from db_tools.print import print_search_results, print_diff
+from db_tools.cache import QUERY_CACHE
+from db_tools.backends import DBGridTDHF
+from db_tools.backends.arrays import ARRAY_CACHE
+
+DB_FILES = ("dbtools.db", "dbtools.db-journal", "dbtools.db-wal", "dbtools.db-shm")
+PRINT_STYLES = ("names", "brief", "full", "diff", "ndjson", "csv", "table")
+
+
+def measure(func, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "repeats": times,
+    }
+
+
+def pool_value(typestr, i):
+    if typestr == "int":
+        return 10 * (i + 1)
+    if typestr == "float":
+        return round(0.01 * (i + 1), 4)
+    if typestr == "bool":
+        return bool(i % 2)
+    return STR_VALUES[i]
+
+
+def selective_filters(keys):
+    """exact matches on the first three keys, matching about 1 / POOL_SIZE**3 of the runs"""
+    return {key: pool_value(typestr, 2) for key, typestr in keys[:3]}
+
+
+def broad_filters(keys):
+    """a range matching all runs on the first numeric key"""
+    for key, typestr in keys:
+        if typestr in ("int", "float"):
+            return {key: Range(0, pool_value(typestr, POOL_SIZE))}
+    return {}
+
+
+def remove_database(prefix):
+    for name in DB_FILES:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(prefix, name))
+    QUERY_CACHE.clear()
+
+
+def has_backend_files(dbtools, fileroots):
+    """whether the grid-tdhf backend can load the run, which needs its info.npz and samples.npz
+
+    Trees generated with --format json have no info.npz.
+    """
+    run_dirs = dbtools._run_dirs(fileroots)
+    return all(
+        os.path.exists(dbtools._file_path(run_dirs, fileroots[0], suffix))
+        for suffix in ("info.npz", "samples.npz")
+    )
+
+
+def run_benchmarks(prefix, keys, repeat, jobs, generated):
+    """time every code path; the database is only recreated if the tree was generated"""
+    results = {}
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results["update_full"] = measure(
+            lambda: update(prefix, jobs=jobs),
+            repeat=max(1, repeat // 2),
+            setup=(lambda: remove_database(prefix)) if generated else None,
+        )
+        results["update_fast"] = measure(
+            lambda: update(prefix, fast=True, jobs=jobs), repeat
+        )
+
+        dbtools = DBGridTDHF().with_prefix(prefix)
+        for name, filters in [
+            ("search_selective", selective_filters(keys)),
+            ("search_broad", broad_filters(keys)),
+        ]:
+            results[name] = measure(
+                lambda: dbtools.search(update=False, **filters),
+                repeat,
+                setup=QUERY_CACHE.clear,
+            )
+            results[f"{name}_cached"] = measure(
+                lambda: dbtools.search(update=False, **filters), repeat
+            )
+
+        for style in PRINT_STYLES:
+            results[f"print_style_{style}"] = measure(
+                lambda: print_search_results(prefix, {}, print_style=style), repeat
+            )
+
+        fileroots = dbtools.search(update=False).fileroots
+        results["print_diff"] = measure(
+            lambda: print_diff(prefix, fileroots[0], fileroots[-1]), repeat
+        )
+
+        if has_backend_files(dbtools, fileroots[:1]):
+            one = dbtools.with_fileroots(fileroots[:1])
+            results["load"] = measure(
+                lambda: np.sum(one.load(load_state=False).samples.expec_z),
+                repeat,
+                setup=ARRAY_CACHE.clear,
+            )
+            many = dbtools.with_fileroots(fileroots[:100])
+            results["load_many_100"] = measure(
+                lambda: many.load_many(stack=True), repeat, setup=ARRAY_CACHE.clear
+            )
+
+    search_args = []
+    for key, value in selective_filters(keys).items():
+        search_args += [f"-{key}", str(value)]
+    results["cli_search"] = measure(
+        lambda: subprocess.run(
+            ["dbtools", "search", "--prefix", prefix, "--no-update"]
+            + search_args
+            + ["--print-style", "names"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        ),
+        repeat,
+    )
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--prefix",
+        type=str,
+        help="Benchmark an existing output directory instead of generating one",
+    )
+    parser.add_argument("--runs", type=int, default=10000)
+    parser.add_argument("--keys", type=int, default=12, help="Number of input keys")
+    parser.add_argument("--format", choices=["npz", "json"], default="npz")
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument(
+        "--shard-levels",
+        type=int,
+        default=0,
+        help="Generate runs in this many levels of hashed subdirectories",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=1, help="--jobs for update")
+    parser.add_argument(
+        "--output", type=str, help="Write results here (default: stdout)"
+    )
+    args = parser.parse_args()
+
+    keys = input_keys(args.keys)
+    tmp_dir = None
+    prefix = args.prefix
+    if prefix is None:
+        tmp_dir = tempfile.mkdtemp(prefix="dbtools-bench-")
+        prefix = os.path.join(tmp_dir, "output")
+        start = time.perf_counter()
+        generate_tree(
+            prefix,
+            args.runs,
+            n_keys=args.keys,
+            file_format=args.format,
+            n_samples=args.samples,
+            jobs=os.cpu_count() or 1,
+            shard_levels=args.shard_levels,
+        )
+        print(
+            f"Generated {args.runs} runs in {time.perf_counter() - start:.1f} s",
+            file=sys.stderr,
+        )
+
+    try:
+        results = run_benchmarks(
+            prefix, keys, args.repeat, args.jobs, generated=tmp_dir is not None
+        )
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "runs": args.runs if args.prefix is None else None,
+            "keys": args.keys,
+            "format": args.format,
+            "samples": args.samples,
+            "shard_levels": args.shard_levels,
+            "repeat": args.repeat,
+            "jobs": args.jobs,
+        },
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,17 @@
-from .api import DBTools
+# the exports are imported on first access, so the command line tool does not
+# pay for importing dataclasses when it is started
+
+
+def __getattr__(name):
+    if name == "DBTools":
+        from .api import DBTools
+
+        return DBTools
+    if name in ("Range", "OneOf", "Approx"):
+        from . import filters
+
+        return getattr(filters, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ["DBTools", "Range", "OneOf", "Approx"]
@@ -1,7 +1,17 @@
 import os
-from .db import get_db_connection, fetch_inputs
-from .main import update as update_database
-from .search import find_filenames_by_subset_inputs
+from contextlib import contextmanager
+from .db import get_db_connection, fetch_inputs, fetch_inputs_many, fetch_run_dirs
+from .main import update_if_stale, register_runs
+from .search import find_fileroots, iter_matching_entries
+from .watch import watcher_is_alive
+from .cache import cached_query
+from .federated import (
+    expand_prefixes,
+    map_prefixes,
+    find_federated_entries,
+    split_fileroot,
+)
+from .timing import span, timed_iter, collect
 
 from dataclasses import dataclass, field, replace
 
@@ -11,37 +21,214 @@ class DBTools:
     prefix: str = field(default="output")
     base_filters: dict[str, str] = field(default_factory=dict)
     fileroots: list[str] = field(default_factory=list)
+    max_age: float = field(default=0.0)
 
     def with_prefix(self, prefix):
+        """use one output directory, or a list of them (glob patterns are expanded)
+
+        With a list, searches query all directories in parallel and fileroots
+        are tagged with their directory as <prefix>/<fileroot>.
+        """
+        if not isinstance(prefix, str):
+            prefix = expand_prefixes(prefix)
         return replace(self, prefix=prefix)
 
+    def with_max_age(self, max_age):
+        return replace(self, max_age=max_age)
+
     def with_base_filters(self, **base_filters):
         return replace(self, base_filters=base_filters)
 
     def with_fileroots(self, fileroots):
         return replace(self, fileroots=fileroots)
 
-    def search(self, update=True, **filters):
-        if update:
-            update_database(self.prefix, prune=True, fast=True)
+    def _is_federated(self):
+        return not isinstance(self.prefix, str)
+
+    def _prefixes(self):
+        return list(self.prefix) if self._is_federated() else [self.prefix]
+
+    def _locate(self, fileroot):
+        """(prefix, fileroot) of a fileroot of this instance"""
+        if self._is_federated():
+            return split_fileroot(fileroot)
+        return self.prefix, fileroot
+
+    def _run_dirs(self, fileroots):
+        """{fileroot: directory of its files}, from the paths recorded in the database"""
+        ret = {}
+        for prefix, names in self._group_by_prefix(fileroots).items():
+            rel_dirs = {}
+            # runs of a directory without database are at its top level
+            if os.path.exists(self._db_path(prefix)):
+                conn = self._connect(prefix)
+                try:
+                    rel_dirs = fetch_run_dirs(conn, list(names))
+                finally:
+                    conn.close()
+            for name, fileroot in names.items():
+                ret[fileroot] = os.path.join(prefix, rel_dirs.get(name, ""))
+        return ret
+
+    def _file_path(self, run_dirs, fileroot, suffix):
+        _, name = self._locate(fileroot)
+        return os.path.join(run_dirs[fileroot], f"{name}_{suffix}")
+
+    def _group_by_prefix(self, fileroots):
+        """{prefix: {fileroot in the prefix: fileroot of this instance}}"""
+        groups = {}
+        for fileroot in fileroots:
+            prefix, name = self._locate(fileroot)
+            groups.setdefault(prefix, {})[name] = fileroot
+        return groups
+
+    def _update_if_needed(self, update):
+        if not update:
+            return
+
+        def update_prefix(prefix):
+            if not watcher_is_alive(prefix):
+                update_if_stale(prefix, self.max_age, prune=True, fast=True)
 
+        with span("auto_update"):
+            map_prefixes(update_prefix, self._prefixes())
+
+    def _all_filters(self, filters):
         all_filters = self.base_filters.copy()
         all_filters.update(filters)
+        return all_filters
 
-        db_path = os.path.join(self.prefix, "dbtools.db")
-        conn = get_db_connection(db_path)
-        results = find_filenames_by_subset_inputs(all_filters, conn)
-        conn.close()
-        fileroots = [fileroot for fileroot, _, _ in results]
+    def _db_path(self, prefix=None):
+        return os.path.join(prefix or self.prefix, "dbtools.db")
 
-        return replace(self, fileroots=fileroots)
+    def _connect(self, prefix=None):
+        return get_db_connection(self._db_path(prefix))
+
+    def search(self, update=True, **filters):
+        with span("api.search"):
+            self._update_if_needed(update)
+
+            all_filters = self._all_filters(filters)
+            if self._is_federated():
+                entries = find_federated_entries(self.prefix, all_filters)
+                return replace(self, fileroots=[entry.name for entry in entries])
+
+            def run_query():
+                conn = self._connect()
+                try:
+                    return tuple(find_fileroots(all_filters, conn))
+                finally:
+                    conn.close()
+
+            fileroots = cached_query(
+                self._db_path(), "fileroots", all_filters, run_query
+            )
+
+        return replace(self, fileroots=list(fileroots))
+
+    def iter_search(self, update=True, **filters):
+        self._update_if_needed(update)
+
+        if self._is_federated():
+            yield from find_federated_entries(self.prefix, self._all_filters(filters))
+            return
+
+        conn = self._connect()
+        try:
+            yield from timed_iter(
+                iter_matching_entries(self._all_filters(filters), conn),
+                "api.iter_search",
+            )
+        finally:
+            conn.close()
 
     def get_inputs(self, fileroot):
-        db_path = os.path.join(self.prefix, "dbtools.db")
-        conn = get_db_connection(db_path)
-        inputs = fetch_inputs(conn, fileroot)
-        conn.close()
+        prefix, name = self._locate(fileroot)
+        with span("api.get_inputs"):
+            conn = self._connect(prefix)
+            inputs = fetch_inputs(conn, name)
+            conn.close()
+        return inputs
+
+    def get_inputs_many(self, fileroots):
+        inputs = dict.fromkeys(fileroots)
+        with span("api.get_inputs", fileroots=len(fileroots)):
+            for prefix, names in self._group_by_prefix(fileroots).items():
+                conn = self._connect(prefix)
+                for name, values in fetch_inputs_many(conn, list(names)).items():
+                    inputs[names[name]] = values
+                conn.close()
         return inputs
 
+    def register(self, *fileroots, wal=False, **kwargs):
+        """add runs to the database right after their info files were written
+
+        Only the given runs are parsed and written, in one transaction that is
+        retried while other jobs write to the database; see main.register_runs
+        for the options. Returns the registered fileroots and raises the error
+        of the first run that could not be read, after registering the others.
+        """
+        if self._is_federated():
+            raise ValueError("Runs can only be registered with a single prefix")
+
+        registered, errors = register_runs(self.prefix, fileroots, wal=wal, **kwargs)
+        if errors:
+            raise next(iter(errors.values()))
+        return registered
+
+    @staticmethod
+    def timings():
+        """context manager collecting the phases timed inside it, e.g.
+
+        with dbtools.timings() as timings:
+            dbtools.search(omega=0.057).load()
+        print(timings.summary())
+        """
+        return collect()
+
+    @contextmanager
+    def session(self, update=True):
+        if self._is_federated():
+            raise ValueError("A session needs a single prefix")
+
+        self._update_if_needed(update)
+
+        conn = self._connect()
+        try:
+            yield DBSession(self, conn)
+        finally:
+            conn.close()
+
     def load(self):
         raise NotImplementedError
+
+
+class DBSession:
+    """DBTools queries sharing one open connection, created by DBTools.session()
+
+    The database is only refreshed once, when the session is opened. Queries
+    reuse the statements prepared on the connection.
+    """
+
+    def __init__(self, dbtools, conn):
+        self.dbtools = dbtools
+        self.conn = conn
+
+    def search(self, **filters):
+        all_filters = self.dbtools._all_filters(filters)
+        fileroots = cached_query(
+            self.dbtools._db_path(),
+            "fileroots",
+            all_filters,
+            lambda: tuple(find_fileroots(all_filters, self.conn)),
+        )
+        return replace(self.dbtools, fileroots=list(fileroots))
+
+    def iter_search(self, **filters):
+        return iter_matching_entries(self.dbtools._all_filters(filters), self.conn)
+
+    def get_inputs(self, fileroot):
+        return fetch_inputs(self.conn, fileroot)
+
+    def get_inputs_many(self, fileroots):
+        return fetch_inputs_many(self.conn, fileroots)
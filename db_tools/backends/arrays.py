@@ -0,0 +1,298 @@
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from collections.abc import Mapping
+from functools import partial
+
+import numpy as np
+
+from .run_results import unwrap_0d_arrays
+
+LOCAL_HEADER = struct.Struct("<4s22xHH")
+
+
+class ArrayCache:
+    """process-wide LRU cache of loaded arrays, bounded by their size in memory
+
+    Keys contain the file's mtime and size, so a rewritten file is never served
+    from the cache. Memory-mapped arrays are not cached, as each of them keeps
+    a file open and mapping it again is cheap. If cache_dir is set,
+    decompressed members are also written there as .npy files and
+    memory-mapped from there on later loads, also by other processes.
+    max_bytes=0 disables the cache.
+    """
+
+    def __init__(self, max_bytes=512 * 2**20, cache_dir=None, max_entries=1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, array):
+        """cache array, which must not be used by the caller afterwards; returns
+        whether it was cached"""
+        nbytes = array.nbytes
+        if self.max_bytes <= 0 or self.max_entries <= 0 or nbytes > self.max_bytes:
+            return False
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self.entries[key] = (array, nbytes)
+            self.nbytes += nbytes
+            self.evict()
+        return True
+
+    def evict(self):
+        while self.entries and (
+            self.nbytes > self.max_bytes or len(self.entries) > self.max_entries
+        ):
+            _, (_, nbytes) = self.entries.popitem(last=False)
+            self.nbytes -= nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.npy")
+
+    def load_from_disk(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self.disk_path(key)
+        if not os.path.exists(path):
+            return None
+        return memmap_npy(path)
+
+    def store_on_disk(self, key, array):
+        if self.cache_dir is None or array.dtype.hasobject or array.size == 0:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, self.disk_path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+ARRAY_CACHE = ArrayCache(
+    max_bytes=int(os.environ.get("DBTOOLS_ARRAY_CACHE_BYTES", 512 * 2**20)),
+    cache_dir=os.environ.get("DBTOOLS_ARRAY_CACHE_DIR") or None,
+    max_entries=int(os.environ.get("DBTOOLS_ARRAY_CACHE_ENTRIES", 1024)),
+)
+
+
+def configure_array_cache(max_bytes=None, cache_dir=None, max_entries=None):
+    """set the memory budget in bytes, the maximum number of cached arrays
+    and/or the on-disk cache directory ("" disables it)"""
+    with ARRAY_CACHE.lock:
+        if max_bytes is not None:
+            ARRAY_CACHE.max_bytes = max_bytes
+        if max_entries is not None:
+            ARRAY_CACHE.max_entries = max_entries
+        if ARRAY_CACHE.max_bytes <= 0 or ARRAY_CACHE.max_entries <= 0:
+            ARRAY_CACHE.entries.clear()
+            ARRAY_CACHE.nbytes = 0
+        ARRAY_CACHE.evict()
+    if cache_dir is not None:
+        ARRAY_CACHE.cache_dir = cache_dir or None
+
+
+class LazyArrays(Mapping):
+    """read-only mapping of arrays that are only read on first access
+
+    Members are available both as items and as attributes, like AttrDict.
+    Names that are not members are looked up with `fallback`, e.g. to find
+    .npy sidecar files, which are not listed as members.
+    """
+
+    def __init__(self, loaders, unwrap_0d=False, fallback=None, closer=None):
+        self._loaders = loaders
+        self._unwrap_0d = unwrap_0d
+        self._fallback = fallback
+        self._closer = closer
+        self._values = {}
+
+    def __getitem__(self, name):
+        if name in self._values:
+            return self._values[name]
+
+        loader = self._loaders.get(name)
+        if loader is None and self._fallback is not None:
+            loader = self._fallback(name)
+        if loader is None:
+            raise KeyError(name)
+
+        value = loader()
+        if self._unwrap_0d:
+            value = unwrap_0d_arrays({name: value})[name]
+        self._values[name] = value
+        return value
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __iter__(self):
+        return iter(self._loaders)
+
+    def __len__(self):
+        return len(self._loaders)
+
+    def __contains__(self, name):
+        return name in self._loaders
+
+    def __repr__(self):
+        return f"LazyArrays({list(self._loaders)})"
+
+    def close(self):
+        if self._closer is not None:
+            self._closer()
+
+
+def memmap_npy(path, offset=0):
+    """memory-map the .npy array starting at `offset` in `path`, or return None"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        else:
+            return None
+        data_offset = f.tell()
+
+    if dtype.hasobject or 0 in shape:
+        return None
+
+    order = "F" if fortran_order else "C"
+    return np.memmap(
+        path, dtype=dtype, mode="r", offset=data_offset, shape=shape, order=order
+    )
+
+
+def npz_member_offset(path, info):
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        signature, name_length, extra_length = LOCAL_HEADER.unpack(
+            f.read(LOCAL_HEADER.size)
+        )
+    if signature != b"PK\x03\x04":
+        raise zipfile.BadZipFile(f"Bad local file header in {path}")
+    return info.header_offset + LOCAL_HEADER.size + name_length + extra_length
+
+
+def load_npz_member(npz, path, name, mmap=True):
+    info = npz.zip.getinfo(f"{name}.npy")
+    if mmap and info.compress_type == zipfile.ZIP_STORED:
+        array = memmap_npy(path, npz_member_offset(path, info))
+        if array is not None:
+            return array
+    return npz[name]
+
+
+def cache_key(path, name):
+    stat = os.stat(path)
+    return os.path.abspath(path), name, stat.st_mtime_ns, stat.st_size
+
+
+def readonly_view(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def cached_load(key, load, cache=True):
+    """load() an array, shared with other loads of the same key as read-only views"""
+    if not cache:
+        return load()
+
+    array = ARRAY_CACHE.get(key)
+    if array is not None:
+        return readonly_view(array)
+
+    array = ARRAY_CACHE.load_from_disk(key)
+    if array is None:
+        array = load()
+        if not isinstance(array, np.ndarray) or array.dtype.hasobject:
+            # object members hold mutable Python objects and are not shared
+            return array
+        if not isinstance(array, np.memmap):
+            ARRAY_CACHE.store_on_disk(key, array)
+
+    # memory maps are read-only already, and caching them would keep their files open
+    if isinstance(array, np.memmap):
+        return array
+    if ARRAY_CACHE.put(key, array):
+        return readonly_view(array)
+    return array
+
+
+def sidecar_path(path, name):
+    """<fileroot>_<group>.npz -> <fileroot>_<group>.<name>.npy"""
+    return f"{os.path.splitext(path)[0]}.{name}.npy"
+
+
+def load_sidecar(path, mmap=True):
+    if mmap:
+        array = memmap_npy(path)
+        if array is not None:
+            return array
+    return np.load(path, allow_pickle=True)
+
+
+def find_sidecar(path, name, mmap=True, cache=True):
+    sidecar = sidecar_path(path, name)
+    if os.path.exists(sidecar):
+        load = partial(load_sidecar, sidecar, mmap)
+        return partial(cached_load, cache_key(sidecar, None), load, cache)
+    return None
+
+
+def open_npz_lazy(path, unwrap_0d=False, mmap=True, cache=True):
+    """open an npz file without reading any member
+
+    Uncompressed members (np.savez) and .npy sidecars are memory-mapped,
+    compressed and object members are read on first access. Loaded arrays are
+    shared through ARRAY_CACHE unless cache=False.
+    """
+    npz = np.load(path, allow_pickle=True)
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    loaders = {}
+    for name in npz.files:
+        load = partial(load_npz_member, npz, path, name, mmap)
+        loaders[name] = partial(cached_load, (*key, name), load, cache)
+
+    return LazyArrays(
+        loaders,
+        unwrap_0d=unwrap_0d,
+        fallback=partial(find_sidecar, path, mmap=mmap, cache=cache),
+        closer=npz.close,
+    )
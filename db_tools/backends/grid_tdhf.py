@@ -1,31 +1,149 @@
 import numpy as np
 
 from db_tools import DBTools
+from db_tools.pack import load_packed
+from db_tools.timing import span
+from .arrays import LazyArrays, open_npz_lazy
 from .run_results import (
     RunResults,
+    StackedResults,
     AttrDict,
     allow_exactly_one_fileroot,
+    allow_any_fileroots,
+    map_fileroots,
+    stack_ragged,
     unwrap_0d_arrays,
 )
 
 
+def wrap_arrays(arrays, unwrap_0d=False):
+    if arrays is None or isinstance(arrays, LazyArrays):
+        return arrays
+    if unwrap_0d:
+        arrays = unwrap_0d_arrays(arrays)
+    return AttrDict(arrays)
+
+
 class GridTDHFResults(RunResults):
     def __init__(self, fileroot, info, samples, state):
         self.fileroot = fileroot
-        self.info = AttrDict(unwrap_0d_arrays(info))
-        self.samples = AttrDict(samples)
-        if state is None:
-            self.state = None
-        else:
-            self.state = AttrDict(state)
+        self.info = wrap_arrays(info, unwrap_0d=True)
+        self.samples = wrap_arrays(samples)
+        self.state = wrap_arrays(state)
 
 
 class DBGridTDHF(DBTools):
-    def load(self, load_state=True):
+    def load(self, load_state=True, mmap=True):
         fileroot = allow_exactly_one_fileroot(self.fileroots)
-        info = np.load(f"{self.prefix}/{fileroot}_info.npz", allow_pickle=True)
-        samples = np.load(f"{self.prefix}/{fileroot}_samples.npz", allow_pickle=True)
+        run_dirs = self._run_dirs([fileroot])
+        info = open_npz_lazy(
+            self._file_path(run_dirs, fileroot, "info.npz"), unwrap_0d=True, mmap=mmap
+        )
+        samples = open_npz_lazy(
+            self._file_path(run_dirs, fileroot, "samples.npz"), mmap=mmap
+        )
+        state = None
         if load_state:
-            state = np.load(f"{self.prefix}/{fileroot}_state.npz", allow_pickle=True)
+            state = open_npz_lazy(
+                self._file_path(run_dirs, fileroot, "state.npz"), mmap=mmap
+            )
 
         return GridTDHFResults(fileroot, info, samples, state)
+
+    def load_many(
+        self,
+        fields=None,
+        stack=False,
+        load_state=False,
+        max_workers=None,
+        mmap=True,
+        use_pack=True,
+    ):
+        """load the samples of all fileroots, reading the runs on a thread pool
+
+        Only `fields` (default: all members) of the samples are read. Runs
+        packed with `dbtools pack` are read as slices of the pack instead of
+        opening their npz files. Returns a {fileroot: GridTDHFResults} mapping,
+        or with stack=True a StackedResults with one padded array and mask per
+        field.
+        """
+        fileroots = allow_any_fileroots(self.fileroots)
+
+        with span("load_many", runs=len(fileroots)):
+            return self._load_many(
+                fileroots, fields, stack, load_state, max_workers, mmap, use_pack
+            )
+
+    def _load_many(
+        self, fileroots, fields, stack, load_state, max_workers, mmap, use_pack
+    ):
+        run_dirs = self._run_dirs(fileroots)
+        packed = {}
+        if use_pack:
+            with span("load_many.pack", runs=len(fileroots)):
+                for prefix, names in self._group_by_prefix(fileroots).items():
+                    conn = self._connect(prefix)
+                    try:
+                        runs = load_packed(conn, prefix, list(names), fields)
+                    finally:
+                        conn.close()
+                    packed.update(
+                        (names[name], arrays) for name, arrays in runs.items()
+                    )
+
+        def read_samples(fileroot):
+            # the arrays are copied, so caching them would only hold memory and files
+            samples = open_npz_lazy(
+                self._file_path(run_dirs, fileroot, "samples.npz"),
+                mmap=mmap,
+                cache=False,
+            )
+            names = samples if fields is None else fields
+            try:
+                return {name: np.array(samples[name]) for name in names}
+            finally:
+                samples.close()
+
+        unpacked = [fileroot for fileroot in fileroots if fileroot not in packed]
+        samples = dict(packed)
+        with span("load_many.read", runs=len(unpacked)) as read:
+            samples.update(map_fileroots(read_samples, unpacked, max_workers))
+            read.bytes = sum(
+                array.nbytes
+                for fileroot in unpacked
+                for array in samples[fileroot].values()
+            )
+
+        if stack:
+            names = fields
+            if names is None:
+                # only fields that every run has can be stacked
+                names = [
+                    name
+                    for name in samples[fileroots[0]]
+                    if all(name in run_samples for run_samples in samples.values())
+                ]
+            arrays = {}
+            masks = {}
+            for name in names:
+                arrays[name], masks[name] = stack_ragged(
+                    [samples[fileroot][name] for fileroot in fileroots]
+                )
+            return StackedResults(fileroots, arrays, masks)
+
+        results = {}
+        for fileroot in fileroots:
+            info = open_npz_lazy(
+                self._file_path(run_dirs, fileroot, "info.npz"),
+                unwrap_0d=True,
+                mmap=mmap,
+            )
+            state = None
+            if load_state:
+                state = open_npz_lazy(
+                    self._file_path(run_dirs, fileroot, "state.npz"), mmap=mmap
+                )
+            results[fileroot] = GridTDHFResults(
+                fileroot, info, samples[fileroot], state
+            )
+        return results
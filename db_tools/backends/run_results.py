@@ -1,4 +1,5 @@
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 
 class AttrDict(dict):
@@ -16,6 +17,34 @@ class RunResults:
     """generic class for storing run results"""
 
 
+class StackedResults:
+    """per-field arrays of several runs, padded along the first axis
+
+    arrays[field][i] holds the field of run fileroots[i], and masks[field][i]
+    marks which entries along the first axis exist for that run.
+    """
+
+    def __init__(self, fileroots, arrays, masks):
+        self.fileroots = fileroots
+        self.arrays = AttrDict(arrays)
+        self.masks = AttrDict(masks)
+
+    def __getattr__(self, name):
+        # self.arrays is not set yet while unpickling or copying
+        arrays = self.__dict__.get("arrays")
+        if name.startswith("_") or arrays is None or name not in arrays:
+            raise AttributeError(name)
+        return arrays[name]
+
+
+class NoMatchError(LookupError):
+    pass
+
+
+class MultipleMatchesError(LookupError):
+    pass
+
+
 def allow_exactly_one_fileroot(fileroots):
     if isinstance(fileroots, str):
         return fileroots
@@ -44,3 +73,43 @@ def unwrap_0d_arrays(d):
             ret[key] = val
 
     return ret
+
+
+def allow_any_fileroots(fileroots):
+    if isinstance(fileroots, str):
+        return [fileroots]
+
+    if isinstance(fileroots, list):
+        if not fileroots:
+            raise NoMatchError("The DBTools instance does not have any fileroots")
+        return fileroots
+
+    raise TypeError("Fileroots must be of type 'str' or 'list'")
+
+
+def map_fileroots(func, fileroots, max_workers=None):
+    """apply func to every fileroot on a thread pool, keeping the order of fileroots"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(fileroots, executor.map(func, fileroots)))
+
+
+def stack_ragged(arrays, fill_value=np.nan):
+    """stack arrays whose first axis may differ in length, returning (stacked, mask)"""
+    arrays = [np.asarray(a) for a in arrays]
+    length = max((len(a) for a in arrays), default=0)
+    trailing_shapes = {a.shape[1:] for a in arrays}
+    if len(trailing_shapes) > 1:
+        raise ValueError(f"Arrays differ beyond the first axis: {trailing_shapes}")
+    trailing_shape = trailing_shapes.pop() if trailing_shapes else ()
+
+    dtype = np.result_type(*arrays) if arrays else np.float64
+    if not np.issubdtype(dtype, np.inexact) and fill_value is np.nan:
+        fill_value = 0
+
+    stacked = np.full((len(arrays), length, *trailing_shape), fill_value, dtype=dtype)
+    mask = np.zeros((len(arrays), length), dtype=bool)
+    for i, a in enumerate(arrays):
+        stacked[i, : len(a)] = a
+        mask[i, : len(a)] = True
+
+    return stacked, mask
@@ -0,0 +1,109 @@
+import itertools
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class QueryCache:
+    """LRU cache of query results, each stored with the database version it was read at"""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+QUERY_CACHE = QueryCache()
+
+# connections kept open for database_version, least recently used are closed
+MAX_VERSION_CONNECTIONS = 16
+
+_version_connections = OrderedDict()
+_version_lock = threading.Lock()
+_connection_ids = itertools.count()
+
+
+def database_version(db_path):
+    """token that changes whenever any connection commits to the database
+
+    PRAGMA data_version only moves for commits made by other connections, so it
+    is read from a dedicated connection that is kept open and never writes. The
+    inode guards against the database file being replaced.
+    """
+    db_path = os.path.abspath(db_path)
+    try:
+        inode = os.stat(db_path).st_ino
+    except FileNotFoundError:
+        return None
+
+    with _version_lock:
+        conn = _version_connections.get(db_path)
+        if conn is None or conn[0] != inode:
+            if conn is not None:
+                conn[1].close()
+            conn = (
+                inode,
+                sqlite3.connect(db_path, check_same_thread=False),
+                next(_connection_ids),
+            )
+            _version_connections[db_path] = conn
+        _version_connections.move_to_end(db_path)
+        data_version = conn[1].execute("PRAGMA data_version").fetchone()[0]
+
+        while len(_version_connections) > MAX_VERSION_CONNECTIONS:
+            _, (_, evicted, _) = _version_connections.popitem(last=False)
+            evicted.close()
+
+    # data_version is only comparable on the same connection, so a reopened
+    # connection invalidates the results cached with the previous one
+    return inode, conn[2], data_version
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def cached_query(db_path, name, filters, run_query):
+    """return run_query(), or its cached result for the same filters and database version"""
+    key = (os.path.abspath(db_path), name, freeze(filters))
+    # read the version first, so a commit racing with the query invalidates it
+    version = database_version(db_path)
+
+    if version is None:
+        return run_query()
+
+    result = QUERY_CACHE.get(key, version)
+    if result is None:
+        result = run_query()
+        QUERY_CACHE.put(key, version, result)
+    return result
+
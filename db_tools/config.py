@@ -2,7 +2,13 @@ import json
 import os
 
 
-def load_config(basename):
+# merged configs by basename, with the (path, mtime_ns) signature they were read at;
+# the cache only lives in the process, where it saves parsing the files again when
+# one command loads a config several times, but each load still stats every path
+_config_cache = {}
+
+
+def config_paths(basename):
     config_name = f"{basename}.json"
     replace_name = f"{basename}.replace.json"
 
@@ -14,18 +20,47 @@ def load_config(basename):
         os.path.join(cwd, "dbtools." + replace_name),
         os.path.join(config_home, replace_name),
     ]
+    merge_paths = [
+        os.path.join(install_dir, "dbtools." + config_name),
+        os.path.join(config_home, config_name),
+        os.path.join(cwd, "dbtools." + config_name),
+    ]
+    return replace_paths, merge_paths
+
+
+def path_signature(paths):
+    signature = []
+    for path in paths:
+        try:
+            signature.append((path, os.stat(path).st_mtime_ns))
+        except OSError:
+            signature.append((path, None))
+    return tuple(signature)
 
+
+def load_config(basename):
+    """the merged config, re-read only when one of its files appears, changes or disappears
+
+    Returns a new dict on each call, so callers may modify it.
+    """
+    replace_paths, merge_paths = config_paths(basename)
+    signature = path_signature(replace_paths + merge_paths)
+
+    cached = _config_cache.get(basename)
+    if cached is None or cached[0] != signature:
+        cached = (signature, read_config(replace_paths, merge_paths))
+        _config_cache[basename] = cached
+    return dict(cached[1])
+
+
+def read_config(replace_paths, merge_paths):
     for path in replace_paths:
         if os.path.exists(path):
             with open(path) as f:
                 return json.load(f)
 
     config = {}
-    for path in [
-        os.path.join(install_dir, "dbtools." + config_name),
-        os.path.join(config_home, config_name),
-        os.path.join(cwd, "dbtools." + config_name),
-    ]:
+    for path in merge_paths:
         if os.path.exists(path):
             with open(path) as f:
                 config.update(json.load(f))
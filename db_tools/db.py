@@ -1,9 +1,87 @@
 import sqlite3
 import json
+import os
+import random
+import time
+
+from .config import load_input_keys
+from .utils import canonical_input_value
+from .timing import span
+
+SCHEMA_VERSION = 2
 
 
 def get_db_connection(db_path, timeout=300):
-    return sqlite3.connect(db_path, timeout=timeout)
+    conn = sqlite3.connect(db_path, timeout=timeout)
+    # keep the rollback journal file in place between transactions, so writes to
+    # the database do not touch the mtime of the output directory it lives in
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode")
+    if cursor.fetchall()[0][0] == "delete":
+        cursor.execute("PRAGMA journal_mode=TRUNCATE").fetchall()
+    ensure_schema(conn)
+    return conn
+
+
+# SQLITE_BUSY and SQLITE_LOCKED, the primary result codes of lock contention
+BUSY_ERROR_CODES = (5, 6)
+
+
+def is_busy_error(error):
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        # extended result codes keep the primary code in the low byte
+        return code & 0xFF in BUSY_ERROR_CODES
+    message = str(error)
+    return "locked" in message or "busy" in message
+
+
+def retry_on_busy(func, retries=8, base_delay=0.05, max_delay=2.0):
+    """return func(), calling it again while the database is busy
+
+    Busy errors are retried up to `retries` times, after a random delay that
+    doubles with every attempt up to max_delay, so many writers starting at
+    the same time spread out instead of retrying in lockstep.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except sqlite3.OperationalError as e:
+            if attempt == retries or not is_busy_error(e):
+                raise
+            delay = min(max_delay, base_delay * 2**attempt)
+            time.sleep(random.uniform(0.5, 1.0) * delay)
+
+
+def get_schema_version(conn):
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchall()[0][0]
+
+
+def ensure_schema(conn):
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return
+
+    create_table_if_not_exists(conn)
+    ensure_extra_fields_column(conn)
+    ensure_rel_dir_column(conn)
+    create_manifest_tables_if_not_exist(conn)
+    create_input_values_table_if_not_exists(conn)
+
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # another process may have migrated while we waited for the write lock
+        version = get_schema_version(conn)
+        if version < SCHEMA_VERSION:
+            if version < 1:
+                backfill_input_values(conn)
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
 
 
 def create_table_if_not_exists(conn):
@@ -15,13 +93,180 @@ def create_table_if_not_exists(conn):
             filename TEXT NOT NULL UNIQUE,
             inputs TEXT NOT NULL,
             extra_fields TEXT,
-            mtime REAL
+            mtime REAL,
+            rel_dir TEXT NOT NULL DEFAULT ''
         )
         """
     )
     conn.commit()
 
 
+def create_manifest_tables_if_not_exist(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scan_dirs (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scan_files (
+            file TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL
+        )
+        """
+    )
+    conn.commit()
+
+
+def create_pack_index_if_not_exists(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pack_index (
+            filename TEXT NOT NULL,
+            file_group TEXT NOT NULL,
+            field TEXT NOT NULL,
+            path TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            dtype TEXT NOT NULL,
+            shape TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            PRIMARY KEY (filename, file_group, field)
+        ) WITHOUT ROWID
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS output_files_delete_pack_index
+        AFTER DELETE ON output_files
+        BEGIN
+            DELETE FROM pack_index WHERE filename = old.filename;
+        END
+        """
+    )
+    conn.commit()
+
+
+def has_table(conn, name):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    )
+    return cursor.fetchone() is not None
+
+
+def create_input_values_table_if_not_exists(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS input_values (
+            filename_id INTEGER NOT NULL,
+            key TEXT NOT NULL,
+            num_value REAL,
+            str_value TEXT,
+            PRIMARY KEY (filename_id, key)
+        ) WITHOUT ROWID
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS input_values_num
+        ON input_values (key, num_value, filename_id)
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS input_values_str
+        ON input_values (key, str_value, filename_id)
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS output_files_delete_input_values
+        AFTER DELETE ON output_files
+        BEGIN
+            DELETE FROM input_values WHERE filename_id = old.id;
+        END
+        """
+    )
+    conn.commit()
+
+
+def canonical_input_rows(inputs, input_types):
+    return [
+        (key, *canonical_input_value(value, input_types.get(key)))
+        for key, value in inputs.items()
+    ]
+
+
+def backfill_input_values(conn, input_types=None):
+    if input_types is None:
+        input_types = load_input_keys()
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, inputs FROM output_files")
+    rows = []
+    for filename_id, inputs_json in cursor.fetchall():
+        for row in canonical_input_rows(json.loads(inputs_json), input_types):
+            rows.append((filename_id, *row))
+    cursor.executemany(
+        "INSERT OR REPLACE INTO input_values (filename_id, key, num_value, str_value) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+
+
+def fetch_dir_mtime(conn, path):
+    cursor = conn.cursor()
+    cursor.execute("SELECT mtime_ns FROM scan_dirs WHERE path = ?", (path,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def store_dir_mtime(conn, path, mtime_ns):
+    with conn:
+        if mtime_ns is None:
+            conn.execute("DELETE FROM scan_dirs WHERE path = ?", (path,))
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO scan_dirs (path, mtime_ns) VALUES (?, ?)",
+                (path, mtime_ns),
+            )
+
+
+def fetch_dir_mtimes(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT path, mtime_ns FROM scan_dirs")
+    return dict(cursor.fetchall())
+
+
+def store_dir_mtimes(conn, dir_mtimes):
+    """replace all recorded directory mtimes with dir_mtimes ({path: mtime_ns})"""
+    with conn:
+        conn.execute("DELETE FROM scan_dirs")
+        conn.executemany(
+            "INSERT INTO scan_dirs (path, mtime_ns) VALUES (?, ?)", dir_mtimes.items()
+        )
+
+
+def fetch_file_manifest(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT file, mtime_ns, size FROM scan_files")
+    return {file: (mtime_ns, size) for file, mtime_ns, size in cursor.fetchall()}
+
+
+def delete_file_fingerprints(conn, files):
+    with conn:
+        conn.executemany(
+            "DELETE FROM scan_files WHERE file = ?", ((file,) for file in files)
+        )
+
+
 def ensure_extra_fields_column(conn):
     cursor = conn.cursor()
     cursor.execute("PRAGMA table_info(output_files)")
@@ -31,18 +276,118 @@ def ensure_extra_fields_column(conn):
         conn.commit()
 
 
-def add_entry_to_database(conn, filename, inputs, extra_fields, mtime):
+def ensure_rel_dir_column(conn):
     cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR REPLACE INTO output_files (filename, inputs, extra_fields, mtime) VALUES (?, ?, ?, ?)",
-        (
-            filename,
-            json.dumps(inputs),
-            json.dumps(extra_fields) if extra_fields else None,
-            mtime,
-        ),
+    cursor.execute("PRAGMA table_info(output_files)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if "rel_dir" not in columns:
+        # runs registered before nested layouts were supported are all at the top level
+        cursor.execute(
+            "ALTER TABLE output_files ADD COLUMN rel_dir TEXT NOT NULL DEFAULT ''"
+        )
+        conn.commit()
+
+
+def enable_wal(conn):
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL").fetchall()
+    cursor.execute("PRAGMA synchronous=NORMAL")
+
+
+def serialize_entry(filename, inputs, extra_fields, mtime, rel_dir=""):
+    return (
+        filename,
+        json.dumps(inputs),
+        json.dumps(extra_fields) if extra_fields else None,
+        mtime,
+        rel_dir,
     )
-    conn.commit()
+
+
+UPSERT_ENTRY_SQL = """
+    INSERT INTO output_files (filename, inputs, extra_fields, mtime, rel_dir)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (filename) DO UPDATE SET
+        inputs = excluded.inputs,
+        extra_fields = excluded.extra_fields,
+        mtime = excluded.mtime,
+        rel_dir = excluded.rel_dir
+"""
+DELETE_INPUT_VALUES_SQL = """
+    DELETE FROM input_values
+    WHERE filename_id = (SELECT id FROM output_files WHERE filename = ?)
+"""
+INSERT_INPUT_VALUE_SQL = """
+    INSERT INTO input_values (filename_id, key, num_value, str_value)
+    SELECT id, ?, ?, ? FROM output_files WHERE filename = ?
+"""
+INSERT_FINGERPRINT_SQL = (
+    "INSERT OR REPLACE INTO scan_files (file, mtime_ns, size) VALUES (?, ?, ?)"
+)
+
+
+def add_entry_to_database(conn, filename, inputs, extra_fields, mtime):
+    with BatchWriter(conn) as writer:
+        writer.add(filename, inputs, extra_fields, mtime)
+
+
+class BatchWriter:
+    """buffers entries and writes each batch with executemany in a single transaction"""
+
+    def __init__(self, conn, batch_size=1000, input_types=None):
+        self.conn = conn
+        self.batch_size = max(1, batch_size)
+        self.input_types = load_input_keys() if input_types is None else input_types
+        self.entries = {}
+        self.fingerprints = []
+
+    def add(self, filename, inputs, extra_fields, mtime, file=None, fingerprint=None):
+        """queue an entry; file is the info file path relative to the output directory"""
+        rel_dir = os.path.dirname(file) if file else ""
+        self.entries[filename] = (
+            serialize_entry(filename, inputs, extra_fields, mtime, rel_dir),
+            canonical_input_rows(inputs, self.input_types),
+        )
+        if fingerprint is not None:
+            self.fingerprints.append((file, *fingerprint))
+        if len(self.entries) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.entries:
+            return
+        input_rows = [
+            (key, num_value, str_value, filename)
+            for filename, (_, rows) in self.entries.items()
+            for key, num_value, str_value in rows
+        ]
+        with span("update.write", rows=len(self.entries)) as write, self.conn:
+            self.conn.executemany(
+                UPSERT_ENTRY_SQL, (row for row, _ in self.entries.values())
+            )
+            self.conn.executemany(
+                DELETE_INPUT_VALUES_SQL, ((filename,) for filename in self.entries)
+            )
+            self.conn.executemany(INSERT_INPUT_VALUE_SQL, input_rows)
+            if self.fingerprints:
+                self.conn.executemany(INSERT_FINGERPRINT_SQL, self.fingerprints)
+            write.bytes = sum(
+                len(row[1]) + len(row[2] or "") for row, _ in self.entries.values()
+            )
+        self.clear()
+
+    def clear(self):
+        self.entries = {}
+        self.fingerprints = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.clear()
 
 
 def fetch_inputs(conn, filename):
@@ -58,6 +403,129 @@ def fetch_inputs(conn, filename):
     return None, None
 
 
+def fetch_inputs_many(conn, filenames):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT filename, inputs, extra_fields FROM output_files
+        WHERE filename IN (SELECT value FROM json_each(?))
+        """,
+        (json.dumps(list(filenames)),),
+    )
+    ret = dict.fromkeys(filenames, (None, None))
+    for filename, inputs_json, extra_fields_json in cursor:
+        extra_fields = json.loads(extra_fields_json) if extra_fields_json else {}
+        ret[filename] = (json.loads(inputs_json), extra_fields)
+    return ret
+
+
+def fetch_run_dirs(conn, filenames=None):
+    """{filename: directory of its files relative to the output directory}
+
+    The directory is '' for runs at the top level. Without filenames, all runs
+    are returned in the order they were added; otherwise unknown filenames are
+    left out.
+    """
+    cursor = conn.cursor()
+    if filenames is None:
+        cursor.execute("SELECT filename, rel_dir FROM output_files ORDER BY id")
+    else:
+        cursor.execute(
+            """
+            SELECT filename, rel_dir FROM output_files
+            WHERE filename IN (SELECT value FROM json_each(?))
+            """,
+            (json.dumps(list(filenames)),),
+        )
+    return dict(cursor.fetchall())
+
+
+def fetch_extended_fileroots(conn, fileroots):
+    """the filenames in the database that start with <fileroot>_ for one of fileroots"""
+    cursor = conn.cursor()
+    ret = set()
+    for fileroot in fileroots:
+        # "`" follows "_", so the range holds exactly the names starting with <fileroot>_
+        cursor.execute(
+            "SELECT filename FROM output_files WHERE filename >= ? AND filename < ?",
+            (f"{fileroot}_", f"{fileroot}`"),
+        )
+        ret.update(filename for filename, in cursor)
+    return ret
+
+
+def has_nested_runs(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM output_files WHERE rel_dir != '' LIMIT 1")
+    return cursor.fetchone() is not None
+
+
+def fetch_filenames(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT filename FROM output_files ORDER BY id")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def fetch_pack_fingerprints(conn, group):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT DISTINCT filename, mtime_ns, size FROM pack_index WHERE file_group = ?",
+        (group,),
+    )
+    return {filename: (mtime_ns, size) for filename, mtime_ns, size in cursor}
+
+
+def fetch_pack_index(conn, filenames, group):
+    """{filename: {field: (path, offset, dtype, shape, (mtime_ns, size))}} of packed runs"""
+    if not has_table(conn, "pack_index"):
+        return {}
+
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT filename, field, path, offset, dtype, shape, mtime_ns, size
+        FROM pack_index
+        WHERE file_group = ? AND filename IN (SELECT value FROM json_each(?))
+        """,
+        (group, json.dumps(list(filenames))),
+    )
+    ret = {}
+    for filename, field, path, offset, dtype, shape, mtime_ns, size in cursor:
+        ret.setdefault(filename, {})[field] = (
+            path,
+            offset,
+            dtype,
+            tuple(json.loads(shape)),
+            (mtime_ns, size),
+        )
+    return ret
+
+
+def store_pack_entries(conn, group, rows):
+    """rows of (filename, field, path, offset, dtype, shape, (mtime_ns, size))"""
+    with conn:
+        conn.executemany(
+            "DELETE FROM pack_index WHERE filename = ? AND file_group = ?",
+            {(row[0], group) for row in rows},
+        )
+        conn.executemany(
+            """
+            INSERT INTO pack_index
+            (filename, file_group, field, path, offset, dtype, shape, mtime_ns, size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                (filename, group, field, path, offset, dtype, json.dumps(shape), *fp)
+                for filename, field, path, offset, dtype, shape, fp in rows
+            ),
+        )
+
+
+def delete_pack_index(conn, group):
+    with conn:
+        conn.execute("DELETE FROM pack_index WHERE file_group = ?", (group,))
+
+
 def count_entries(conn):
     cursor = conn.cursor()
     cursor.execute("SELECT COUNT(*) FROM output_files")
@@ -69,3 +537,47 @@ def delete_db_entry(conn, filename):
     cursor = conn.cursor()
     cursor.execute("DELETE FROM output_files WHERE filename = ?", (filename,))
     conn.commit()
+
+
+def delete_db_entries(conn, filenames, files=()):
+    """delete entries, and the fingerprints of their info `files`, in one transaction
+
+    Returns the number of deleted entries.
+    """
+    with conn:
+        cursor = conn.executemany(
+            "DELETE FROM output_files WHERE filename = ?",
+            ((filename,) for filename in filenames),
+        )
+        n_deleted = cursor.rowcount
+        conn.executemany(
+            "DELETE FROM scan_files WHERE file = ?", ((file,) for file in files)
+        )
+    return n_deleted
+
+
+def prune_missing_entries(conn, keep_filenames):
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS keep_filenames (filename TEXT PRIMARY KEY)"
+        )
+        cursor.execute("DELETE FROM keep_filenames")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO keep_filenames (filename) VALUES (?)",
+            ((filename,) for filename in keep_filenames),
+        )
+        cursor.execute(
+            """
+            SELECT o.filename FROM output_files o
+            LEFT JOIN keep_filenames k ON k.filename = o.filename
+            WHERE k.filename IS NULL
+            """
+        )
+        missing = [row[0] for row in cursor.fetchall()]
+        if missing:
+            cursor.execute(
+                "DELETE FROM output_files WHERE filename NOT IN (SELECT filename FROM keep_filenames)"
+            )
+        cursor.execute("DELETE FROM keep_filenames")
+    return missing
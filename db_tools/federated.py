@@ -0,0 +1,89 @@
+import glob
+import os
+
+from .cache import cached_query
+from .db import get_db_connection
+from .search import iter_matching_entries, SearchResult
+
+
+def expand_prefixes(prefixes):
+    """output directories named by prefixes, with glob patterns expanded
+
+    The order is kept and a directory named twice, also through different
+    paths, is only returned once.
+    """
+    if isinstance(prefixes, str):
+        prefixes = [prefixes]
+
+    ret = []
+    seen = set()
+    for prefix in prefixes:
+        matches = sorted(glob.glob(prefix)) if glob.has_magic(prefix) else [prefix]
+        for match in matches:
+            real_path = os.path.realpath(match)
+            if real_path not in seen:
+                seen.add(real_path)
+                ret.append(match.rstrip("/") or match)
+    return ret
+
+
+def map_prefixes(func, prefixes, max_workers=None):
+    """[(prefix, func(prefix))] for all prefixes, run on a thread pool"""
+    if len(prefixes) == 1:
+        return [(prefixes[0], func(prefixes[0]))]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max_workers or min(32, len(prefixes))) as ex:
+        return list(zip(prefixes, ex.map(func, prefixes)))
+
+
+def split_fileroot(tagged):
+    """(prefix, fileroot) of a fileroot tagged as <prefix>/<fileroot>, see SearchResult.name"""
+    return os.path.split(tagged)
+
+
+def merge_entries(results):
+    """flatten [(prefix, rows)] into one list of SearchResults with .prefix set
+
+    The same run found in several prefixes, i.e. the same fileroot with the
+    same inputs, is kept once, from the first prefix.
+    """
+    seen = set()
+    merged = []
+    for prefix, rows in results:
+        for fileroot, inputs_json, extra_fields_json in rows:
+            key = (fileroot, inputs_json)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(
+                SearchResult(fileroot, inputs_json, extra_fields_json, prefix)
+            )
+    return merged
+
+
+def query_prefix(prefix, search_inputs):
+    """the rows matching search_inputs in one prefix, cached per database version"""
+    db_path = os.path.join(prefix, "dbtools.db")
+
+    def run_query():
+        conn = get_db_connection(db_path)
+        try:
+            return tuple(
+                (entry.fileroot, entry.inputs_json, entry.extra_fields_json)
+                for entry in iter_matching_entries(search_inputs, conn)
+            )
+        finally:
+            conn.close()
+
+    return cached_query(db_path, "rows", search_inputs, run_query)
+
+
+def find_federated_entries(prefixes, search_inputs, max_workers=None):
+    """entries matching search_inputs in all prefixes, queried in parallel"""
+    return merge_entries(
+        map_prefixes(
+            lambda prefix: query_prefix(prefix, search_inputs), prefixes, max_workers
+        )
+    )
@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Range:
+    """matches values with low <= value <= high; either bound may be None"""
+
+    low: float = None
+    high: float = None
+
+    def bounds(self):
+        return self.low, self.high
+
+
+@dataclass(frozen=True)
+class OneOf:
+    """matches any of the given values"""
+
+    values: tuple
+
+    def __init__(self, *values):
+        object.__setattr__(self, "values", tuple(values))
+
+
+@dataclass(frozen=True)
+class Approx:
+    """matches values within max(rel_tol * |value|, abs_tol) of value, like math.isclose"""
+
+    value: float
+    rel_tol: float = 1e-9
+    abs_tol: float = 0.0
+
+    def bounds(self):
+        tol = max(self.rel_tol * abs(self.value), self.abs_tol)
+        return self.value - tol, self.value + tol
@@ -1,9 +1,202 @@
 import json
 import os
-import numpy as np
+from functools import partial
+
+# numpy, zipfile and the executors are imported where they are used, so
+# commands that only scan the directory or query the database start quickly
+
+
+INFO_SUFFIXES = ("_info.npz", "_info.json")
+
+# extra fields larger than this are stored as a reference and a summary
+INLINE_MAX_BYTES = 4096
+# pickled npz members (e.g. metadata dicts) are only read up to this size, as
+# their size in the database is only known after unpickling them
+PICKLE_MAX_BYTES = 2**20
+# larger numeric npz members are summarized without reading them, i.e. without min and max
+SUMMARY_MAX_BYTES = 2**20
+
+# threads scanning the subdirectories of nested output directories
+SCAN_WORKERS = 8
+# subdirectories of the output directory that never contain runs
+SKIP_DIRS = ("dbtools.pack",)
+
+
+def info_fileroot(name):
+    for suffix in INFO_SUFFIXES:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return None
+
+
+def join_rel(rel_dir, name):
+    return f"{rel_dir}/{name}" if rel_dir else name
+
+
+def list_info_dir(output_dir, rel_dir=""):
+    """(info files, subdirectories) directly in output_dir/rel_dir
+
+    Info files are (file, fileroot, (mtime_ns, size)) and subdirectories are
+    paths, both relative to output_dir. Hidden directories, SKIP_DIRS and
+    symlinks to directories are not descended into.
+    """
+    files = []
+    subdirs = []
+    with os.scandir(os.path.join(output_dir, rel_dir)) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith(".") and entry.name not in SKIP_DIRS:
+                    subdirs.append(join_rel(rel_dir, entry.name))
+                continue
+            fileroot = info_fileroot(entry.name)
+            if fileroot is None or not entry.is_file():
+                continue
+            stat = entry.stat()
+            files.append(
+                (
+                    join_rel(rel_dir, entry.name),
+                    fileroot,
+                    (stat.st_mtime_ns, stat.st_size),
+                )
+            )
+    return files, subdirs
+
+
+def scan_tree(output_dir, dir_mtimes=None, manifest=None, max_workers=SCAN_WORKERS):
+    """find the info files in output_dir and all its subdirectories
+
+    Returns (files, scanned_dir_mtimes, listed): the info files as in
+    list_info_dir, the mtime_ns of every directory and whether any directory
+    had to be listed. A directory whose mtime equals the one in dir_mtimes
+    ({rel_dir: mtime_ns}) is not listed again; its info files are taken from
+    manifest ({file: (mtime_ns, size)}) and its subdirectories from dir_mtimes.
+    The subdirectories of output_dir are scanned in parallel.
+    """
+    dir_mtimes = dir_mtimes or {}
+
+    known_subdirs = {}
+    for path in dir_mtimes:
+        if path:
+            known_subdirs.setdefault(os.path.dirname(path), []).append(path)
+    known_files = {}
+    for file, fingerprint in (manifest or {}).items():
+        fileroot = info_fileroot(os.path.basename(file))
+        known_files.setdefault(os.path.dirname(file), []).append(
+            (file, fileroot, fingerprint)
+        )
+
+    def visit(rel_dir):
+        """(mtime_ns, files, subdirs, listed) of one directory"""
+        try:
+            mtime_ns = os.stat(os.path.join(output_dir, rel_dir)).st_mtime_ns
+            if dir_mtimes.get(rel_dir) == mtime_ns:
+                return (
+                    mtime_ns,
+                    known_files.get(rel_dir, []),
+                    known_subdirs.get(rel_dir, []),
+                    False,
+                )
+            # the mtime is read before listing, so later changes are noticed next time
+            return (mtime_ns, *list_info_dir(output_dir, rel_dir), True)
+        except (FileNotFoundError, NotADirectoryError):
+            # removed while scanning; its parent has changed, too
+            return None, [], [], True
+
+    def walk(rel_dir):
+        files = []
+        mtimes = {}
+        listed = False
+        stack = [rel_dir]
+        while stack:
+            path = stack.pop()
+            mtime_ns, dir_files, subdirs, dir_listed = visit(path)
+            if mtime_ns is not None:
+                mtimes[path] = mtime_ns
+            files.extend(dir_files)
+            stack.extend(subdirs)
+            listed = listed or dir_listed
+        return files, mtimes, listed
+
+    mtime_ns, files, subdirs, listed = visit("")
+    mtimes = {"": mtime_ns}
+    if len(subdirs) <= 1:
+        results = map(walk, subdirs)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(subdirs))) as ex:
+            results = list(ex.map(walk, subdirs))
+
+    files = list(files)
+    for subdir_files, subdir_mtimes, subdir_listed in results:
+        files.extend(subdir_files)
+        mtimes.update(subdir_mtimes)
+        listed = listed or subdir_listed
+    return files, mtimes, listed
+
+
+def tree_unchanged(output_dir, dir_mtimes, max_workers=SCAN_WORKERS):
+    """whether all directories in dir_mtimes still have the recorded mtime
+
+    New subdirectories change the mtime of their parent, so this is enough to
+    tell that no directory of the tree has to be listed again. It is not if
+    the parent of a recorded directory is unknown, so the tree counts as
+    changed then. Files rewritten in place do not change their directory and
+    are not noticed.
+    """
+    if "" not in dir_mtimes or any(
+        os.path.dirname(path) not in dir_mtimes for path in dir_mtimes if path
+    ):
+        return False
+
+    def unchanged(path):
+        try:
+            return (
+                os.stat(os.path.join(output_dir, path)).st_mtime_ns == dir_mtimes[path]
+            )
+        except OSError:
+            return False
+
+    if len(dir_mtimes) == 1:
+        return unchanged("")
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        return all(ex.map(unchanged, dir_mtimes))
+
+
+def resolve_info_file(output_dir, name):
+    """path relative to output_dir of the info file of a run, or None if there is none
+
+    name is a fileroot, a path of a run below output_dir (relative to it or
+    to the working directory), or the path of its info file.
+    """
+    root = info_fileroot(name) or name
+    candidates = []
+    if not os.path.isabs(root):
+        candidates.append(os.path.normpath(root))
+    rel_path = os.path.relpath(os.path.abspath(root), os.path.abspath(output_dir))
+    if not rel_path.startswith(".."):
+        candidates.append(rel_path)
+
+    for candidate in candidates:
+        if candidate.startswith(".."):
+            continue
+        for suffix in INFO_SUFFIXES:
+            if os.path.isfile(os.path.join(output_dir, candidate + suffix)):
+                return candidate + suffix
+    return None
+
+
+def scan_info_files(output_dir):
+    """(file, fileroot, (mtime_ns, size)) of all info files below output_dir"""
+    return scan_tree(output_dir)[0]
 
 
 def load_info_file(file_path):
+    import numpy as np
+
     if file_path.endswith(".npz"):
         data = np.load(file_path, allow_pickle=True)
         inputs = data["inputs"].item()
@@ -27,14 +220,261 @@ def load_info_file(file_path):
         raise ValueError(f"Unsupported file format: {file_path}")
 
 
-def delete_output_files(output_dir, fileroot):
-    deleted_files = []
-    for file in os.listdir(output_dir):
-        if file.startswith(fileroot):
-            path = os.path.join(output_dir, file)
+def read_npy_header(f):
+    """(shape, fortran_order, dtype) from a .npy stream, or None for unknown versions"""
+    import numpy as np
+
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    if version == (2, 0):
+        return np.lib.format.read_array_header_2_0(f)
+    return None
+
+
+def read_npz_info(file_path, inline_max_bytes=INLINE_MAX_BYTES):
+    """read an npz info file without decompressing its large members
+
+    Returns (inputs, extra_fields, summaries). Of each member only the .npy
+    header is read first; `inputs` and members of at most inline_max_bytes are
+    then read completely. Larger members are returned in `summaries`; numeric
+    members of at most SUMMARY_MAX_BYTES are read to include their min and
+    max, larger ones are never decompressed. Pickled members are read up to
+    PICKLE_MAX_BYTES, taken from the zip directory, and size-checked after.
+    """
+    import zipfile
+    import numpy as np
+
+    inputs = None
+    extra_fields = {}
+    summaries = {}
+    file = os.path.basename(file_path)
+
+    with zipfile.ZipFile(file_path) as zf:
+        for info in zf.infolist():
+            if not info.filename.endswith(".npy"):
+                continue
+            key = info.filename[: -len(".npy")]
+            ref = {"file": file, "member": key}
+            capped = key != "inputs" and inline_max_bytes is not None
+
+            with zf.open(info) as f:
+                header = read_npy_header(f)
+                if header is None or header[2].hasobject:
+                    max_bytes = max(inline_max_bytes or 0, PICKLE_MAX_BYTES)
+                    if capped and info.file_size > max_bytes:
+                        summaries[key] = {
+                            "__omitted__": {"ref": ref, "bytes": info.file_size}
+                        }
+                        continue
+                    with zf.open(info) as member:
+                        value = np.lib.format.read_array(member, allow_pickle=True)
+                else:
+                    shape, fortran_order, dtype = header
+                    nbytes = dtype.itemsize * int(np.prod(shape))
+                    summarized = capped and nbytes > inline_max_bytes
+                    if summarized and (
+                        nbytes > SUMMARY_MAX_BYTES or dtype.kind not in "biuf"
+                    ):
+                        summaries[key] = {
+                            "__array__": {
+                                "ref": ref,
+                                "shape": list(shape),
+                                "dtype": str(dtype),
+                            }
+                        }
+                        continue
+                    order = "F" if fortran_order else "C"
+                    value = np.frombuffer(f.read(nbytes), dtype=dtype)
+                    value = value.reshape(shape, order=order)
+                    if summarized:
+                        summaries[key] = summarize_array(value, ref)
+                        continue
+
+            if key == "inputs":
+                inputs = value.item()
+                continue
             try:
-                os.remove(path)
+                value = value.item()
+            except Exception:
+                pass
+            extra_fields[key] = value
+
+    if inputs is None:
+        raise KeyError("inputs is not a file in the archive")
+    return inputs, extra_fields, summaries
+
+
+def summarize_array(array, ref):
+    import numpy as np
+
+    summary = {"ref": ref, "shape": list(array.shape), "dtype": str(array.dtype)}
+    if array.dtype.kind in "biuf" and array.size:
+        finite = array[np.isfinite(array)] if array.dtype.kind == "f" else array
+        if finite.size:
+            summary["min"] = finite.min().item()
+            summary["max"] = finite.max().item()
+    return {"__array__": summary}
+
+
+def compact_value(value, ref, inline_max_bytes=INLINE_MAX_BYTES):
+    """JSON-serializable form of an extra field value
+
+    Numpy scalars and arrays of up to inline_max_bytes are converted to Python
+    values, with bytes decoded as UTF-8. Larger (and complex) arrays are replaced by a summary holding
+    `ref`, their shape, dtype and range of values.
+    """
+    import numpy as np
+
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return compact_value(value.tolist(), ref, inline_max_bytes)
+        if value.dtype.kind in "biufUS" and (
+            inline_max_bytes is None or value.nbytes <= inline_max_bytes
+        ):
+            if value.dtype.kind == "S":
+                return compact_value(value.tolist(), ref, inline_max_bytes)
+            return value.tolist()
+        return summarize_array(value, ref)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, complex):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "backslashreplace")
+    if isinstance(value, dict):
+        return {
+            str(k): compact_value(v, ref, inline_max_bytes) for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [compact_value(v, ref, inline_max_bytes) for v in value]
+    return value
+
+
+def compact_extra_fields(extra_fields, file, inline_max_bytes=INLINE_MAX_BYTES):
+    import numpy as np
+
+    ret = {}
+    for key, value in extra_fields.items():
+        ref = {"file": file, "member": key}
+        # arrays were already size-checked by compact_value
+        is_array = isinstance(value, np.ndarray) and not value.dtype.hasobject
+        value = compact_value(value, ref, inline_max_bytes)
+
+        if inline_max_bytes is not None and not is_array:
+            # e.g. long lists in JSON info files
+            n_bytes = len(json.dumps(value, default=str))
+            if n_bytes > inline_max_bytes:
+                try:
+                    array = np.asarray(value)
+                except ValueError:
+                    array = None
+                if array is not None and array.dtype.kind in "biuf":
+                    value = summarize_array(array, ref)
+                else:
+                    value = {"__omitted__": {"ref": ref, "bytes": n_bytes}}
+
+        ret[key] = value
+    return ret
+
+
+def parse_info_file(file_path, inline_max_bytes=INLINE_MAX_BYTES):
+    try:
+        summaries = {}
+        if file_path.endswith(".npz"):
+            inputs, extra_fields, summaries = read_npz_info(file_path, inline_max_bytes)
+        else:
+            inputs, extra_fields = load_info_file(file_path)
+        extra_fields = compact_extra_fields(
+            extra_fields, os.path.basename(file_path), inline_max_bytes
+        )
+        extra_fields.update(summaries)
+    except Exception as e:
+        return file_path, None, None, str(e)
+    return file_path, inputs, extra_fields, None
+
+
+def iter_parsed_info_files(file_paths, jobs=1, inline_max_bytes=INLINE_MAX_BYTES):
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+
+    parse = partial(parse_info_file, inline_max_bytes=inline_max_bytes)
+
+    if jobs == 1 or len(file_paths) < 2:
+        for file_path in file_paths:
+            yield parse(file_path)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, min(256, len(file_paths) // (4 * jobs)))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(parse, file_paths, chunksize=chunksize)
+
+
+def file_owner(name, fileroots):
+    """the longest of fileroots that name starts with, followed by "_", or None"""
+    owner = None
+    i = name.find("_")
+    while i != -1:
+        if name[:i] in fileroots:
+            owner = name[:i]
+        i = name.find("_", i + 1)
+    return owner
+
+
+def find_output_files(output_dir, fileroots, run_dirs=None, known_fileroots=()):
+    """paths of the files that belong to one of fileroots
+
+    A file belongs to the longest fileroot its name starts with, followed by
+    "_", among fileroots, known_fileroots (e.g. the runs in the database) and
+    the runs with an info file in the same directory; so the files of run_2
+    are not taken for files of run. The files of a run are looked for in its
+    directory from run_dirs ({fileroot: rel_dir}, default: the top level),
+    and the returned paths are relative to output_dir. Each directory is
+    scanned once, however many fileroots it holds.
+    """
+    by_dir = {}
+    for fileroot in fileroots:
+        by_dir.setdefault((run_dirs or {}).get(fileroot, ""), set()).add(fileroot)
+
+    files = []
+    for rel_dir, dir_fileroots in by_dir.items():
+        try:
+            with os.scandir(os.path.join(output_dir, rel_dir)) as entries:
+                names = [entry.name for entry in entries if not entry.is_dir()]
+        except FileNotFoundError:
+            continue
+
+        owners = dir_fileroots.union(known_fileroots)
+        owners.update(info_fileroot(name) for name in names)
+        for name in names:
+            if file_owner(name, owners) in dir_fileroots:
+                files.append(join_rel(rel_dir, name))
+    return files
+
+
+def delete_files(output_dir, files, max_workers=8):
+    """remove files on a thread pool and return the names of those that were removed"""
+
+    def remove(file):
+        try:
+            os.remove(os.path.join(output_dir, file))
+        except Exception as e:
+            return e
+        return None
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    deleted_files = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for file, error in zip(files, executor.map(remove, files)):
+            if error is not None:
+                print(f"Failed to delete {file}: {error}")
+            else:
                 deleted_files.append(file)
-            except Exception as e:
-                print(f"Failed to delete {file}: {e}")
     return deleted_files
+
+
+def delete_output_files(output_dir, fileroot):
+    return delete_files(output_dir, find_output_files(output_dir, [fileroot]))
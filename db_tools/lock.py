@@ -0,0 +1,102 @@
+import errno
+import os
+import time
+from contextlib import contextmanager
+
+from .timing import span
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where updates are not serialized
+    fcntl = None
+
+LOCK_NAME = "dbtools.lock"
+
+
+def open_lock_file(path):
+    """a read-only fd of the lock file, created if missing, or None if that is not possible"""
+    try:
+        return os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        pass
+    try:
+        # a new lock file must not look like a finished update
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o666))
+        os.utime(path, (0, 0))
+        return os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+
+
+def lock_fd(fd, path):
+    """flock fd exclusively, returning the fd that holds the lock or None"""
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+    except OSError as e:
+        os.close(fd)
+        if e.errno != errno.EBADF:
+            raise
+    # NFS emulates flock with POSIX locks, whose exclusive locks need a writable fd
+    try:
+        fd = os.open(path, os.O_WRONLY)
+    except OSError:
+        return None
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
+
+
+@contextmanager
+def update_lock(prefix):
+    """hold an exclusive advisory lock on <prefix>/dbtools.lock
+
+    The mtime of the lock file records when the last update finished; it is
+    set by mark_updated while the lock is held. The lock file is opened
+    read-only, so users without write access to the output directory can run
+    updates that find nothing to change; if the lock file is missing and
+    cannot be created, no lock is taken.
+    """
+    path = os.path.join(prefix, LOCK_NAME)
+    fd = open_lock_file(path)
+    try:
+        if fd is not None and fcntl is not None:
+            with span("update.lock_wait"):
+                fd = lock_fd(fd, path)
+        yield
+    finally:
+        # closing the fd releases the lock
+        if fd is not None:
+            os.close(fd)
+
+
+def mark_updated(prefix):
+    """set the mtime of the lock file, unless it is missing or not writable"""
+    path = os.path.join(prefix, LOCK_NAME)
+    # explicit times, so the mtime is comparable with time.time() even on NFS
+    now = time.time()
+    try:
+        os.utime(path, (now, now))
+    except PermissionError:
+        # explicit times need ownership of the file, the current time only write access
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    except OSError:
+        pass
+
+
+def last_update_time(prefix):
+    try:
+        return os.path.getmtime(os.path.join(prefix, LOCK_NAME))
+    except OSError:
+        return None
+
+
+def is_fresh(prefix, max_age, since=None):
+    last_update = last_update_time(prefix)
+    if last_update is None:
+        return False
+    if since is not None and last_update >= since:
+        return True
+    return max_age > 0 and time.time() - last_update < max_age
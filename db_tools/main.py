@@ -1,115 +1,504 @@
 import argparse
 import os
-import numpy as np
 import sys
+import time
 
 from .db import (
     get_db_connection,
     create_table_if_not_exists,
-    ensure_extra_fields_column,
+    fetch_dir_mtimes,
+    store_dir_mtime,
+    store_dir_mtimes,
+    fetch_file_manifest,
+    delete_file_fingerprints,
+    delete_db_entries,
+    fetch_run_dirs,
+    fetch_extended_fileroots,
+    has_nested_runs,
+    enable_wal,
+    retry_on_busy,
     add_entry_to_database,
+    BatchWriter,
+    prune_missing_entries,
     count_entries,
-    delete_db_entry,
 )
 
 from .io import (
-    load_info_file,
-    delete_output_files,
+    INFO_SUFFIXES,
+    INLINE_MAX_BYTES,
+    info_fileroot,
+    resolve_info_file,
+    parse_info_file,
+    scan_tree,
+    tree_unchanged,
+    iter_parsed_info_files,
+    find_output_files,
+    delete_files,
 )
 
 from .search import (
     get_search_keywords,
+    find_fileroots,
     find_filenames_by_subset_inputs,
 )
 
 from .print import (
     print_db_results,
+    print_search_results,
     print_entry,
     print_diff,
 )
 
 from .config import load_input_keys, load_search_config
-from .utils import check_output_dir, TYPE_MAP
+from .utils import check_output_dir, TYPE_MAP, filter_type, split_tolerance_args
+from .watch import watcher_is_alive
+from .lock import update_lock, mark_updated, is_fresh
+from .timing import span, timed_iter, TIMINGS
+
+
+def ingest_info_files(
+    conn,
+    output_dir,
+    pending,
+    jobs=1,
+    batch_size=1000,
+    inline_max_bytes=INLINE_MAX_BYTES,
+):
+    n_failed = 0
+    parsed = iter_parsed_info_files(
+        [os.path.join(output_dir, file) for _, file, _ in pending],
+        jobs,
+        inline_max_bytes=inline_max_bytes,
+    )
+    # time spent waiting for parse results, with the bytes of the parsed info files
+    parsed = timed_iter(
+        zip(pending, parsed), "update.parse", size=lambda item: item[0][2][1]
+    )
+    with BatchWriter(conn, batch_size=batch_size) as writer:
+        for (filename, file, fingerprint), result in parsed:
+            file_path, inputs, extra_fields, error = result
+            if error is not None:
+                print(f"Failed to process file {file_path}: {error}")
+                n_failed += 1
+                continue
+
+            try:
+                writer.add(
+                    filename,
+                    inputs,
+                    extra_fields,
+                    fingerprint[0] / 1e9,
+                    file=file,
+                    fingerprint=fingerprint,
+                )
+            except Exception as e:
+                print(f"Failed to process file {file_path}: {e}")
+                n_failed += 1
+
+    return n_failed
+
 
+# a directory mtime this close to the current time may still be shared with a
+# modification that happens right after the scan, so it is not recorded
+RACY_MTIME_NS = 2_000_000_000
 
-def update(prefix, prune=True, fast=False):
+
+def settled_dir_mtimes(dir_mtimes):
+    """dir_mtimes without the directories whose mtime is too recent to be trusted
+
+    The ancestors of such a directory are left out, too. A recorded directory
+    is not listed again, and its subdirectories are taken from the recorded
+    ones, so an unrecorded directory must never sit below a recorded one.
+    """
+    now = time.time_ns()
+    unsettled = set()
+    for path, mtime_ns in dir_mtimes.items():
+        if now - mtime_ns <= RACY_MTIME_NS:
+            while path not in unsettled:
+                unsettled.add(path)
+                path = os.path.dirname(path)
+    return {
+        path: mtime_ns for path, mtime_ns in dir_mtimes.items() if path not in unsettled
+    }
+
+
+def update(
+    prefix,
+    prune=True,
+    fast=False,
+    jobs=1,
+    batch_size=1000,
+    wal=False,
+    inline_max_bytes=INLINE_MAX_BYTES,
+):
     if not check_output_dir(prefix):
         return
 
+    with span("update", fast=fast), update_lock(prefix):
+        scan_and_update(prefix, prune, fast, jobs, batch_size, wal, inline_max_bytes)
+        mark_updated(prefix)
+
+
+def update_if_stale(prefix, max_age=0.0, prune=True, fast=True, **kwargs):
+    """run update unless one finished less than max_age seconds ago
+
+    Concurrent callers are serialized by the update lock. A caller that had to
+    wait reuses the result of an update that finished in the meantime.
+    """
+    if not check_output_dir(prefix) or is_fresh(prefix, max_age):
+        return
+
+    requested = time.time()
+    with span("update", fast=fast), update_lock(prefix):
+        if is_fresh(prefix, max_age, since=requested):
+            return
+        scan_and_update(prefix, prune, fast, **kwargs)
+        mark_updated(prefix)
+
+
+def scan_and_update(
+    prefix,
+    prune=True,
+    fast=False,
+    jobs=1,
+    batch_size=1000,
+    wal=False,
+    inline_max_bytes=INLINE_MAX_BYTES,
+):
     output_dir = f"{prefix}/"
     db_path = os.path.join(prefix, "dbtools.db")
 
     conn = get_db_connection(db_path)
-    create_table_if_not_exists(conn)
-    ensure_extra_fields_column(conn)
+    if wal:
+        enable_wal(conn)
 
-    cursor = conn.cursor()
+    dir_mtimes = fetch_dir_mtimes(conn) if fast else {}
 
-    if fast:
-        cursor.execute("SELECT filename, mtime FROM output_files")
-        db_mtimes = dict(cursor.fetchall())
-    else:
-        db_mtimes = {}
+    if fast and tree_unchanged(output_dir, dir_mtimes):
+        conn.close()
+        return
+
+    manifest = fetch_file_manifest(conn)
 
     seen_filenames = set()
+    seen_files = set()
+    pending = []
 
-    for file in os.listdir(output_dir):
-        if file.endswith("_info.npz") or file.endswith("_info.json"):
-            filename = file.replace("_info.npz", "").replace("_info.json", "")
+    with span("update.scan") as scan:
+        files, scanned_dir_mtimes, _ = scan_tree(output_dir, dir_mtimes, manifest)
+        for file, filename, fingerprint in files:
             seen_filenames.add(filename)
+            seen_files.add(file)
 
-            file_path = os.path.join(output_dir, file)
-            current_mtime = os.path.getmtime(file_path)
+            if fast and manifest.get(file) == fingerprint:
+                continue
 
-            if fast and filename in db_mtimes:
-                db_mtime = db_mtimes[filename]
-                if abs(db_mtime - current_mtime) < 1e-6:
-                    continue
+            pending.append((filename, file, fingerprint))
+        scan.attrs.update(
+            files=len(seen_files), dirs=len(scanned_dir_mtimes), pending=len(pending)
+        )
 
-            try:
-                inputs, extra_fields = load_info_file(file_path)
-                add_entry_to_database(
-                    conn, filename, inputs, extra_fields, current_mtime
-                )
-            except Exception as e:
-                print(f"Failed to process file {file_path}: {e}")
+    n_failed = ingest_info_files(
+        conn, output_dir, pending, jobs, batch_size, inline_max_bytes
+    )
 
-    if prune:
-        cursor.execute("SELECT filename FROM output_files")
-        db_filenames = {row[0] for row in cursor.fetchall()}
+    delete_file_fingerprints(conn, set(manifest) - seen_files)
 
-        missing = db_filenames - seen_filenames
+    if prune:
+        with span("update.prune"):
+            missing = prune_missing_entries(conn, seen_filenames)
         for filename in missing:
             print(f"Pruning missing file: {filename}")
-            cursor.execute("DELETE FROM output_files WHERE filename = ?", (filename,))
-        conn.commit()
+
+    # only a complete, pruned scan lets the next fast update skip unchanged directories
+    complete = prune and n_failed == 0
+    store_dir_mtimes(conn, settled_dir_mtimes(scanned_dir_mtimes) if complete else {})
 
     conn.close()
 
 
-def delete(prefix, entry_name, force=False):
+INLINE_MAX_BYTES_HELP = (
+    "Extra fields larger than this are stored as a reference and a summary "
+    "(shape, dtype, and min and max for numeric arrays of up to 1 MiB)"
+)
+
+# registering jobs wait this long for a lock before backing off and retrying
+REGISTER_BUSY_TIMEOUT = 5.0
+REGISTER_RETRIES = 8
+
+
+def register_runs(
+    prefix,
+    names,
+    inline_max_bytes=INLINE_MAX_BYTES,
+    wal=False,
+    retries=REGISTER_RETRIES,
+):
+    """add the runs `names` to the database without scanning the output directory
+
+    The info file of every run is parsed once, then all runs are written with
+    their scan manifest fingerprints in one transaction, which is retried with
+    backoff while other writers hold the database. Returns (registered
+    fileroots, {name: exception} for runs that could not be read).
+    """
+    output_dir = f"{prefix}/"
+    db_path = os.path.join(prefix, "dbtools.db")
+
+    pending = []
+    errors = {}
+    for name in names:
+        file = resolve_info_file(output_dir, name)
+        if file is None:
+            errors[name] = FileNotFoundError(f"No info file found for '{name}'")
+            continue
+        stat = os.stat(os.path.join(output_dir, file))
+        file_path, inputs, extra_fields, error = parse_info_file(
+            os.path.join(output_dir, file), inline_max_bytes
+        )
+        if error is not None:
+            errors[name] = error
+            continue
+        fingerprint = (stat.st_mtime_ns, stat.st_size)
+        pending.append(
+            (
+                info_fileroot(os.path.basename(file)),
+                file,
+                fingerprint,
+                inputs,
+                extra_fields,
+            )
+        )
+
+    def write():
+        conn = get_db_connection(db_path, timeout=REGISTER_BUSY_TIMEOUT)
+        try:
+            if wal:
+                enable_wal(conn)
+            with BatchWriter(conn, batch_size=len(pending) + 1) as writer:
+                for filename, file, fingerprint, inputs, extra_fields in pending:
+                    writer.add(
+                        filename,
+                        inputs,
+                        extra_fields,
+                        fingerprint[0] / 1e9,
+                        file=file,
+                        fingerprint=fingerprint,
+                    )
+        finally:
+            conn.close()
+
+    if pending:
+        with span("register", runs=len(pending)):
+            retry_on_busy(write, retries=retries)
+    return [filename for filename, *_ in pending], errors
+
+
+def register(
+    prefix,
+    names,
+    inline_max_bytes=INLINE_MAX_BYTES,
+    wal=False,
+    retries=REGISTER_RETRIES,
+):
     if not check_output_dir(prefix):
         return
 
-    db_path = os.path.join(prefix, "dbtools.db")
+    registered, errors = register_runs(prefix, names, inline_max_bytes, wal, retries)
+    for name, error in errors.items():
+        print(f"Failed to register {name}: {error}")
+    print(f"Registered {len(registered)} entries")
+    if errors:
+        sys.exit(1)
+
+
+def apply_info_file_changes(
+    conn,
+    output_dir,
+    files,
+    prune=True,
+    jobs=1,
+    batch_size=1000,
+    inline_max_bytes=INLINE_MAX_BYTES,
+):
+    pending = []
+    removed = []
+    for file in sorted(files):
+        try:
+            stat = os.stat(os.path.join(output_dir, file))
+        except FileNotFoundError:
+            removed.append(file)
+            continue
+        pending.append((info_fileroot(file), file, (stat.st_mtime_ns, stat.st_size)))
+
+    ingest_info_files(conn, output_dir, pending, jobs, batch_size, inline_max_bytes)
+
+    delete_file_fingerprints(conn, removed)
+    if prune:
+        # a run stays registered as long as any of its info files is left
+        missing = {
+            filename
+            for filename in map(info_fileroot, removed)
+            if not any(
+                os.path.exists(os.path.join(output_dir, filename + suffix))
+                for suffix in INFO_SUFFIXES
+            )
+        }
+        delete_db_entries(conn, missing)
+        for filename in sorted(missing):
+            print(f"Pruning missing file: {filename}")
+
+    if pending:
+        print(f"Updated {len(pending)} entries")
+
+
+def watch(
+    prefix,
+    prune=True,
+    debounce=1.0,
+    jobs=1,
+    batch_size=1000,
+    wal=False,
+    inline_max_bytes=INLINE_MAX_BYTES,
+):
+    if not check_output_dir(prefix):
+        return
+
+    from .watch import (
+        Inotify,
+        iter_debounced_changes,
+        OVERFLOW,
+        touch_heartbeat,
+        remove_heartbeat,
+    )
+
     output_dir = f"{prefix}/"
+    db_path = os.path.join(prefix, "dbtools.db")
 
-    if not force:
+    try:
+        inotify = Inotify(output_dir)
+    except OSError as e:
+        print(f"Error: Cannot watch '{output_dir}': {e}")
+        return
+
+    # events arriving during the initial scan are queued by the kernel and
+    # applied afterwards, so nothing is lost between the scan and the loop
+    update(
+        prefix,
+        prune=prune,
+        fast=True,
+        jobs=jobs,
+        batch_size=batch_size,
+        wal=wal,
+        inline_max_bytes=inline_max_bytes,
+    )
+
+    conn = get_db_connection(db_path)
+    if has_nested_runs(conn):
+        # inotify watches are per directory, and only the top level is watched
         print(
-            f"WARNING: This will permanently delete all files matching '{entry_name}*' in '{output_dir}'"
+            f"Error: '{output_dir}' has runs in subdirectories, which cannot be watched; use update instead."
         )
-        print(f"and remove the entry from the database '{db_path}'.")
-        confirm = input("Are you sure? Type 'yes' to confirm: ")
-        if confirm.strip().lower() != "yes":
-            print("Aborted.")
-            return
+        conn.close()
+        inotify.close()
+        return
+
+    touch_heartbeat(prefix)
+    print(f"Watching '{output_dir}' for changes (press Ctrl-C to stop)")
+
+    def is_info_file(name):
+        return info_fileroot(name) is not None
+
+    try:
+        with inotify:
+            for changed in iter_debounced_changes(inotify, is_info_file, debounce):
+                if changed is OVERFLOW:
+                    print("Event queue overflowed, rescanning output directory")
+                    store_dir_mtime(conn, "", None)
+                    update(
+                        prefix,
+                        prune=prune,
+                        fast=True,
+                        jobs=jobs,
+                        batch_size=batch_size,
+                        wal=wal,
+                        inline_max_bytes=inline_max_bytes,
+                    )
+                elif changed:
+                    apply_info_file_changes(
+                        conn,
+                        output_dir,
+                        changed,
+                        prune,
+                        jobs,
+                        batch_size,
+                        inline_max_bytes,
+                    )
+                touch_heartbeat(prefix)
+        print(f"Output directory '{output_dir}' was removed or moved, stopping")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remove_heartbeat(prefix)
+        conn.close()
+
+
+def resolve_delete_targets(conn, entry_names, filters):
+    """fileroots to delete: the search matches of filters, restricted to entry_names if given"""
+    if not filters:
+        return list(dict.fromkeys(entry_names))
+
+    matches = find_fileroots(filters, conn)
+    if entry_names:
+        entry_names = set(entry_names)
+        matches = [fileroot for fileroot in matches if fileroot in entry_names]
+    return matches
+
+
+def delete(prefix, entry_names=(), force=False, *, filters=None, jobs=8):
+    if not check_output_dir(prefix):
+        return
+
+    if isinstance(entry_names, str):
+        entry_names = [entry_names]
+
+    if not entry_names and not filters:
+        print("Error: Give the fileroots to delete, or search filters selecting them.")
+        return
+
+    db_path = os.path.join(prefix, "dbtools.db")
+    output_dir = f"{prefix}/"
 
-    deleted_files = delete_output_files(output_dir, entry_name)
     conn = get_db_connection(db_path)
-    delete_db_entry(conn, entry_name)
-    conn.close()
+    try:
+        fileroots = resolve_delete_targets(conn, entry_names, filters)
+        if not fileroots:
+            print("No matching entries.")
+            return
+
+        if not force:
+            shown = ", ".join(fileroots[:5]) + (", ..." if len(fileroots) > 5 else "")
+            print(
+                f"WARNING: This will permanently delete all files of {len(fileroots)} entries ({shown}) in '{output_dir}'"
+            )
+            print(f"and remove the entries from the database '{db_path}'.")
+            confirm = input("Are you sure? Type 'yes' to confirm: ")
+            if confirm.strip().lower() != "yes":
+                print("Aborted.")
+                return
 
-    print("Deleted database entry.")
+        files = find_output_files(
+            output_dir,
+            fileroots,
+            fetch_run_dirs(conn, fileroots),
+            known_fileroots=fetch_extended_fileroots(conn, fileroots),
+        )
+        deleted_files = delete_files(output_dir, files, max_workers=jobs)
+        info_files = [file for file in deleted_files if info_fileroot(file) is not None]
+        n_deleted = delete_db_entries(conn, fileroots, info_files)
+    finally:
+        conn.close()
+
+    print(f"Deleted {n_deleted} database entries.")
     if deleted_files:
         print("Deleted files:")
         for file in deleted_files:
@@ -118,28 +507,69 @@ def delete(prefix, entry_name, force=False):
         print("No files deleted.")
 
 
-def number(prefix):
+def read_entry_names(entry_names):
+    """expand "-" in entry_names into the fileroots read from stdin, one per line"""
+    ret = []
+    for name in entry_names:
+        if name == "-":
+            ret.extend(line.strip() for line in sys.stdin if line.strip())
+        else:
+            ret.append(name)
+    return ret
+
+
+def pack(prefix, group="samples", rebuild=False, jobs=4):
+    if not check_output_dir(prefix):
+        return
+
+    from .pack import pack_runs
+
+    db_path = os.path.join(prefix, "dbtools.db")
+    with update_lock(prefix):
+        conn = get_db_connection(db_path)
+        try:
+            n_packed = pack_runs(conn, prefix, group, rebuild=rebuild, jobs=jobs)
+        finally:
+            conn.close()
+
+    print(f"Packed {n_packed} runs")
+
+
+def count_prefix_entries(prefix):
     db_path = os.path.join(prefix, "dbtools.db")
     conn = get_db_connection(db_path)
     num_entries = count_entries(conn)
     conn.close()
-    print(f"Number of entries in the database: {num_entries}")
+    return num_entries
+
+
+def number(prefix):
+    if isinstance(prefix, str):
+        print(f"Number of entries in the database: {count_prefix_entries(prefix)}")
+        return
+
+    from .federated import map_prefixes
+
+    counts = map_prefixes(count_prefix_entries, prefix)
+    for output_dir, num_entries in counts:
+        print(f"Number of entries in {output_dir}: {num_entries}")
+    print(f"Number of entries in all databases: {sum(n for _, n in counts)}")
 
 
 def search(prefix, args):
+    """[(fileroot, inputs, extra_fields)] of the entries matching the filters in args"""
     if not check_output_dir(prefix):
         return []
 
     db_path = os.path.join(prefix, "dbtools.db")
-    conn = get_db_connection(db_path)
-
     search_keywords = get_search_keywords(args)
 
-    entries = find_filenames_by_subset_inputs(search_keywords, conn)
-
-    conn.close()
-
-    return entries
+    conn = get_db_connection(db_path)
+    try:
+        with span("search"):
+            return find_filenames_by_subset_inputs(search_keywords, conn)
+    finally:
+        conn.close()
 
 
 def apply_search_config(args, search_configs):
@@ -165,10 +595,24 @@ def parse_search(parser):
             print("       Please fix this in your dbtools.inputs.json or .append.json.")
             sys.exit(1)
 
-        parser.add_argument(f"-{key}", type=TYPE_MAP[typestr], help=argparse.SUPPRESS)
+        value_type = TYPE_MAP[typestr]
+        if typestr in ("int", "float"):
+            value_type = filter_type(value_type)
+
+        parser.add_argument(f"-{key}", type=value_type, help=argparse.SUPPRESS)
 
 
-def add_prefix(parser):
+def add_prefix(parser, multiple=False):
+    if multiple:
+        parser.add_argument(
+            "--prefix",
+            type=str,
+            nargs="+",
+            default="output",
+            help="Names of output directories to query together; glob patterns are expanded",
+        )
+        return
+
     parser.add_argument(
         "--prefix",
         type=str,
@@ -177,12 +621,22 @@ def add_prefix(parser):
     )
 
 
+def resolve_prefixes(prefixes):
+    """a single prefix as str, several as a list of existing directories"""
+    from .federated import expand_prefixes
+
+    expanded = expand_prefixes(prefixes)
+    if len(expanded) == 1:
+        return expanded[0]
+    return expanded
+
+
 def add_print_options(parser):
     parser.add_argument(
         "--print-style",
-        choices=["names", "brief", "full", "diff"],
+        choices=["names", "brief", "full", "diff", "ndjson", "csv", "table"],
         default="full",
-        help="Style of output formatting",
+        help="Style of output formatting (ndjson, csv and table are streamed and machine-readable)",
     )
 
     parser.add_argument(
@@ -193,6 +647,35 @@ def add_print_options(parser):
     )
 
 
+def add_ingest_options(parser):
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse info files (0 = all cores)",
+    )
+
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Number of entries written per database transaction",
+    )
+
+    parser.add_argument(
+        "--wal",
+        action="store_true",
+        help="Switch the database to WAL journaling (requires a filesystem with working shared memory, i.e. not NFS)",
+    )
+
+    parser.add_argument(
+        "--inline-max-bytes",
+        type=int,
+        default=INLINE_MAX_BYTES,
+        help=INLINE_MAX_BYTES_HELP,
+    )
+
+
 def add_update_options(parser):
     parser.add_argument(
         "--no-prune",
@@ -201,15 +684,36 @@ def add_update_options(parser):
     )
 
     parser.add_argument(
-        "--fast", action="store_true", help="Skip files already present in the database"
+        "--fast",
+        action="store_true",
+        help="Skip files already present in the database (files rewritten in place are missed, use a full update for those)",
     )
 
+    add_ingest_options(parser)
+
+
+def add_watch_options(parser):
+    parser.add_argument(
+        "--no-prune",
+        action="store_true",
+        help="Do not remove database entries when output files are deleted",
+    )
+
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=1.0,
+        help="Seconds without new events before a batch of changes is applied",
+    )
+
+    add_ingest_options(parser)
+
 
 def add_auto_update_options(parser):
     parser.add_argument(
         "--no-update",
         action="store_true",
-        help="Skip automatic update --fast before running this command",
+        help="Skip automatic update --fast before running this command (also skipped while 'dbtools watch' is running)",
     )
 
     parser.add_argument(
@@ -218,6 +722,13 @@ def add_auto_update_options(parser):
         help="Do not remove database entries for missing output files",
     )
 
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=0.0,
+        help="Skip the automatic update if the last update finished less than this many seconds ago",
+    )
+
 
 def setup_parser():
     parser = argparse.ArgumentParser(
@@ -227,7 +738,7 @@ def setup_parser():
     subparsers = parser.add_subparsers(
         dest="action",
         required=True,
-        metavar="{update|print|print_entry|print_diff|number|search|delete}",
+        metavar="{update|watch|register|print|print_entry|print_diff|number|search|pack|delete}",
     )
 
     # number
@@ -235,7 +746,7 @@ def setup_parser():
         "number", aliases=["n"], help="Print number of entries in database"
     )
 
-    add_prefix(parser_number)
+    add_prefix(parser_number, multiple=True)
     add_auto_update_options(parser_number)
 
     # print
@@ -243,7 +754,7 @@ def setup_parser():
         "print", aliases=["p"], help="Print all database entries"
     )
 
-    add_prefix(parser_print)
+    add_prefix(parser_print, multiple=True)
     add_auto_update_options(parser_print)
     add_print_options(parser_print)
 
@@ -284,7 +795,7 @@ def setup_parser():
         "search", aliases=["s"], help="Search for entries matching input subset"
     )
 
-    add_prefix(parser_search)
+    add_prefix(parser_search, multiple=True)
     add_auto_update_options(parser_search)
     parse_search(parser_search)
     add_print_options(parser_search)
@@ -303,26 +814,121 @@ def setup_parser():
     add_prefix(parser_update)
     add_update_options(parser_update)
 
+    # watch
+    parser_watch = subparsers.add_parser(
+        "watch",
+        aliases=["w"],
+        help="Keep the database up to date by watching the output directory (Linux only)",
+    )
+
+    add_prefix(parser_watch)
+    add_watch_options(parser_watch)
+
+    # pack
+    parser_pack = subparsers.add_parser(
+        "pack",
+        help="Append the arrays of registered runs to per-field files in <prefix>/dbtools.pack",
+    )
+
+    add_prefix(parser_pack)
+    add_auto_update_options(parser_pack)
+
+    parser_pack.add_argument(
+        "--group",
+        type=str,
+        default="samples",
+        help="Pack the <fileroot>_<group>.npz files (default: samples)",
+    )
+
+    parser_pack.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Discard the existing pack of this group and pack all runs again",
+    )
+
+    parser_pack.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        help="Number of threads reading npz files",
+    )
+
+    # register
+    parser_register = subparsers.add_parser(
+        "register",
+        help="Add runs to the database right after their info file was written, without a scan",
+    )
+
+    add_prefix(parser_register)
+
+    parser_register.add_argument(
+        "entry_names",
+        nargs="+",
+        help="Fileroots, run paths or info files of the runs to add ('-' reads them from stdin, one per line)",
+    )
+
+    parser_register.add_argument(
+        "--wal",
+        action="store_true",
+        help="Switch the database to WAL journaling (requires a filesystem with working shared memory, i.e. not NFS)",
+    )
+
+    parser_register.add_argument(
+        "--retries",
+        type=int,
+        default=REGISTER_RETRIES,
+        help="Number of times a write is retried while the database is busy",
+    )
+
+    parser_register.add_argument(
+        "--inline-max-bytes",
+        type=int,
+        default=INLINE_MAX_BYTES,
+        help=INLINE_MAX_BYTES_HELP,
+    )
+
     # delete
     parser_delete = subparsers.add_parser(
-        "delete", aliases=["d"], help="Delete database entry and related output files"
+        "delete",
+        aliases=["d"],
+        help="Delete database entries and related output files, by fileroot or search filters",
     )
 
     add_prefix(parser_delete)
+    add_auto_update_options(parser_delete)
+    parse_search(parser_delete)
 
     parser_delete.add_argument(
-        "entry_name", type=str, help="Name of the output entry to delete"
+        "entry_names",
+        nargs="*",
+        help="Fileroots of the entries to delete ('-' reads them from stdin, one per line); with filters, only matching ones are deleted",
     )
 
     parser_delete.add_argument(
         "--force", action="store_true", help="Delete without confirmation"
     )
 
-    args = parser.parse_args()
+    parser_delete.add_argument(
+        "--jobs",
+        type=int,
+        default=8,
+        help="Number of threads removing files",
+    )
+
+    # aliases map to the same parser
+    for subparser in {id(p): p for p in subparsers.choices.values()}.values():
+        subparser.add_argument(
+            "--timings",
+            action="store_true",
+            help="Print the wall time, calls and bytes of each phase to stderr",
+        )
+
+    args = parser.parse_args(split_tolerance_args(sys.argv[1:], load_input_keys()))
 
     alias_map = {
         "s": "search",
         "u": "update",
+        "w": "watch",
         "p": "print",
         "pe": "print_entry",
         "pd": "print_diff",
@@ -334,30 +940,67 @@ def setup_parser():
     if args.action in alias_map:
         args.action = alias_map[args.action]
 
+    if isinstance(args.prefix, list):
+        args.prefix = resolve_prefixes(args.prefix)
+
     return args
 
 
 def fast_update_if_needed(args):
-    if not getattr(args, "no_update", False):
-        update(args.prefix, prune=not args.no_prune, fast=True)
+    if getattr(args, "no_update", False):
+        return
+
+    def update_prefix(prefix):
+        if not watcher_is_alive(prefix):
+            update_if_stale(
+                prefix, max_age=args.max_age, prune=not args.no_prune, fast=True
+            )
+
+    if isinstance(args.prefix, str):
+        update_prefix(args.prefix)
+    else:
+        from .federated import map_prefixes
+
+        map_prefixes(update_prefix, args.prefix)
 
 
 def main():
     args = setup_parser()
 
-    if not check_output_dir(args.prefix):
+    try:
+        with span("main", action=args.action):
+            run(args)
+    finally:
+        if args.timings:
+            print(TIMINGS.summary(), file=sys.stderr)
+
+
+def run(args):
+    prefixes = [args.prefix] if isinstance(args.prefix, str) else args.prefix
+    if not prefixes:
+        print("Error: No output directory matches the given prefixes.")
+        return
+    if not all([check_output_dir(prefix) for prefix in prefixes]):
         return
 
-    if args.action in {"number", "print", "print_entry", "print_diff", "search"}:
-        fast_update_if_needed(args)
+    if args.action in {
+        "number",
+        "print",
+        "print_entry",
+        "print_diff",
+        "search",
+        "pack",
+        "delete",
+    }:
+        with span("auto_update"):
+            fast_update_if_needed(args)
 
     if args.action == "number":
         number(args.prefix)
 
     elif args.action == "print":
-        entries = search(args.prefix, argparse.Namespace())
-        print_db_results(
-            entries, print_style=args.print_style, show_field=args.show_field
+        print_search_results(
+            args.prefix, {}, print_style=args.print_style, show_field=args.show_field
         )
 
     elif args.action == "print_entry":
@@ -374,19 +1017,61 @@ def main():
             if not apply_search_config(args, search_configs):
                 return
 
-        entries = search(args.prefix, args)
-        print_db_results(
-            entries,
+        print_search_results(
+            args.prefix,
+            get_search_keywords(args),
             print_style=args.print_style,
             print_keys=getattr(args, "print_keys", None),
             show_field=args.show_field,
         )
 
     elif args.action == "update":
-        update(args.prefix, prune=not args.no_prune, fast=args.fast)
+        update(
+            args.prefix,
+            prune=not args.no_prune,
+            fast=args.fast,
+            jobs=args.jobs,
+            batch_size=args.batch_size,
+            wal=args.wal,
+            inline_max_bytes=args.inline_max_bytes,
+        )
+
+    elif args.action == "watch":
+        watch(
+            args.prefix,
+            prune=not args.no_prune,
+            debounce=args.debounce,
+            jobs=args.jobs,
+            batch_size=args.batch_size,
+            wal=args.wal,
+            inline_max_bytes=args.inline_max_bytes,
+        )
+
+    elif args.action == "register":
+        register(
+            args.prefix,
+            read_entry_names(args.entry_names),
+            inline_max_bytes=args.inline_max_bytes,
+            wal=args.wal,
+            retries=args.retries,
+        )
+
+    elif args.action == "pack":
+        pack(args.prefix, args.group, rebuild=args.rebuild, jobs=args.jobs)
 
     elif args.action == "delete":
-        delete(args.prefix, args.entry_name, force=args.force)
+        if "-" in args.entry_names and not args.force:
+            # the confirmation would be read from the same stdin
+            print("Error: Reading fileroots from stdin requires --force.")
+            return
+
+        delete(
+            args.prefix,
+            read_entry_names(args.entry_names),
+            filters=get_search_keywords(args),
+            force=args.force,
+            jobs=args.jobs,
+        )
 
 
 if __name__ == "__main__":
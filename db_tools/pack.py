@@ -0,0 +1,174 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .db import (
+    create_pack_index_if_not_exists,
+    fetch_run_dirs,
+    fetch_pack_fingerprints,
+    fetch_pack_index,
+    store_pack_entries,
+    delete_pack_index,
+)
+
+PACK_DIR = "dbtools.pack"
+# every array starts at a multiple of this, so memory-mapped slices are aligned
+PACK_ALIGNMENT = 64
+
+
+def pack_dir(prefix):
+    return os.path.join(prefix, PACK_DIR)
+
+
+def field_path(group, field):
+    return f"{group}.{field}.bin"
+
+
+def read_run(path):
+    """fingerprint and numeric arrays of an npz file, or None if it is missing"""
+    try:
+        stat = os.stat(path)
+        with np.load(path, allow_pickle=True) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+    except FileNotFoundError:
+        return None
+    arrays = {
+        name: array for name, array in arrays.items() if not array.dtype.hasobject
+    }
+    return (stat.st_mtime_ns, stat.st_size), arrays
+
+
+def append_array(f, array):
+    """append array to f at the next aligned position and return its offset"""
+    position = f.seek(0, os.SEEK_END)
+    padding = -position % PACK_ALIGNMENT
+    if padding:
+        f.write(b"\0" * padding)
+    f.write(np.ascontiguousarray(array).data)
+    return position + padding
+
+
+def pack_runs(conn, prefix, group="samples", rebuild=False, jobs=4, batch_size=256):
+    """append the <fileroot>_<group>.npz arrays of registered runs to the pack
+
+    Each field is stored in its own file in <prefix>/dbtools.pack, with the
+    location of every run's array kept in the pack_index table. Runs whose
+    file did not change since they were packed are skipped; changed runs are
+    appended again, leaving their old data unreferenced until --rebuild.
+    Returns the number of packed runs.
+    """
+    create_pack_index_if_not_exists(conn)
+    directory = pack_dir(prefix)
+
+    if rebuild:
+        delete_pack_index(conn, group)
+        for name in os.listdir(directory) if os.path.isdir(directory) else []:
+            if name.startswith(f"{group}."):
+                os.remove(os.path.join(directory, name))
+
+    os.makedirs(directory, exist_ok=True)
+
+    packed = fetch_pack_fingerprints(conn, group)
+    run_dirs = fetch_run_dirs(conn)
+    filenames = list(run_dirs)
+
+    def read(filename):
+        return read_run(
+            os.path.join(prefix, run_dirs[filename], f"{filename}_{group}.npz")
+        )
+
+    n_packed = 0
+    handles = {}
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for start in range(0, len(filenames), batch_size):
+                batch = filenames[start : start + batch_size]
+                rows = []
+                for filename, run in zip(batch, executor.map(read, batch)):
+                    if run is None or packed.get(filename) == run[0]:
+                        continue
+                    fingerprint, arrays = run
+                    for field, array in arrays.items():
+                        path = field_path(group, field)
+                        if path not in handles:
+                            handles[path] = open(os.path.join(directory, path), "ab")
+                        offset = append_array(handles[path], array)
+                        rows.append(
+                            (
+                                filename,
+                                field,
+                                path,
+                                offset,
+                                array.dtype.str,
+                                array.shape,
+                                fingerprint,
+                            )
+                        )
+                    n_packed += 1
+
+                # the data must be on disk before the index points to it
+                for f in handles.values():
+                    f.flush()
+                    os.fsync(f.fileno())
+                store_pack_entries(conn, group, rows)
+    finally:
+        for f in handles.values():
+            f.close()
+
+    return n_packed
+
+
+class PackReader:
+    """reads packed arrays as slices of one memory map per field file"""
+
+    def __init__(self, prefix):
+        self.directory = pack_dir(prefix)
+        self.buffers = {}
+
+    def buffer(self, path):
+        buffer = self.buffers.get(path)
+        if buffer is None:
+            buffer = np.memmap(os.path.join(self.directory, path), mode="r")
+            self.buffers[path] = buffer
+        return buffer
+
+    def read(self, path, offset, dtype, shape):
+        dtype = np.dtype(dtype)
+        nbytes = dtype.itemsize * int(np.prod(shape))
+        if nbytes == 0:
+            return np.empty(shape, dtype=dtype)
+        return self.buffer(path)[offset : offset + nbytes].view(dtype).reshape(shape)
+
+
+def load_packed(conn, prefix, fileroots, fields=None, group="samples"):
+    """{fileroot: {field: array}} for the fileroots whose packed data is current
+
+    A run is left out if any of `fields` is not packed, or if its npz file
+    changed after it was packed. Runs whose npz file was removed are still
+    served from the pack.
+    """
+    index = fetch_pack_index(conn, fileroots, group)
+    run_dirs = fetch_run_dirs(conn, list(index))
+    reader = PackReader(prefix)
+
+    ret = {}
+    for fileroot, entries in index.items():
+        names = list(entries) if fields is None else fields
+        if any(name not in entries for name in names):
+            continue
+
+        fingerprint = entries[names[0]][4] if names else None
+        try:
+            stat = os.stat(
+                os.path.join(
+                    prefix, run_dirs.get(fileroot, ""), f"{fileroot}_{group}.npz"
+                )
+            )
+            if fingerprint != (stat.st_mtime_ns, stat.st_size):
+                continue
+        except FileNotFoundError:
+            pass
+
+        ret[fileroot] = {name: reader.read(*entries[name][:4]) for name in names}
+    return ret
@@ -1,8 +1,23 @@
+import csv
+import itertools
 import json
 import os
-from .search import get_differing_keys
+import sys
+from .search import (
+    get_differing_keys,
+    iter_matching_entries,
+    find_input_keys,
+    find_differing_keys,
+    order_input_keys,
+    SearchResult,
+)
 from .db import get_db_connection, fetch_inputs
+from .io import info_fileroot, join_rel
 from .utils import check_output_dir
+from .timing import span, timed_iter
+
+STREAM_STYLES = ("ndjson", "csv", "table")
+TABLE_BUFFER_ROWS = 1000
 
 
 def format_entry(
@@ -43,52 +58,228 @@ def format_entry(
     return out
 
 
-def print_db_results(entries, print_style="full", print_keys=None, show_field=None):
-    differing_keys = None
-    if print_style == "diff":
+def print_db_results(
+    entries,
+    print_style="full",
+    print_keys=None,
+    show_field=None,
+    differing_keys=None,
+):
+    if print_style == "diff" and differing_keys is None:
+        entries = list(entries)
         differing_keys = get_differing_keys(entries)
 
-    if entries:
-        print("Matching entries:")
-        for i, (filename, inputs, extra_fields) in enumerate(entries):
-            print(
-                format_entry(
-                    i,
-                    filename,
-                    inputs,
-                    print_style,
-                    differing_keys,
-                    print_keys,
-                    extra_field=extra_fields,
-                    show_fields=show_field,
-                )
+    n_entries = 0
+    for i, (filename, inputs, extra_fields) in enumerate(entries):
+        if i == 0:
+            print("Matching entries:")
+        print(
+            format_entry(
+                i,
+                filename,
+                inputs,
+                print_style,
+                differing_keys,
+                print_keys,
+                extra_field=extra_fields,
+                show_fields=show_field,
             )
-    else:
+        )
+        n_entries += 1
+
+    if n_entries == 0:
         print("No matching records found.")
-    print("Number of matching records:", len(entries))
+    print("Number of matching records:", n_entries)
+
+
+def print_search_results(
+    prefix, search_inputs, print_style="full", print_keys=None, show_field=None
+):
+    if not isinstance(prefix, str):
+        print_federated_results(
+            prefix, search_inputs, print_style, print_keys, show_field
+        )
+        return
+
+    db_path = os.path.join(prefix, "dbtools.db")
+    conn = get_db_connection(db_path)
+    try:
+        # the time spent stepping the query and reading rows, apart from formatting
+        entries = timed_iter(
+            iter_matching_entries(search_inputs, conn),
+            "search.fetch",
+            size=lambda entry: len(entry.inputs_json)
+            + len(entry.extra_fields_json or ""),
+        )
+        if print_style in STREAM_STYLES:
+            if print_keys is None and print_style != "ndjson":
+                with span("search.keys"):
+                    print_keys = find_input_keys(search_inputs, conn)
+            with span("print", style=print_style):
+                print_stream(entries, print_style, print_keys, show_field)
+            return
+
+        differing_keys = None
+        if print_style == "diff":
+            with span("search.keys"):
+                differing_keys = find_differing_keys(search_inputs, conn)
+
+        with span("print", style=print_style):
+            print_db_results(
+                (
+                    (entry.fileroot, entry.inputs, entry.extra_fields)
+                    for entry in entries
+                ),
+                print_style=print_style,
+                print_keys=print_keys,
+                show_field=show_field,
+                differing_keys=differing_keys,
+            )
+    finally:
+        conn.close()
+
+
+def print_federated_results(
+    prefixes, search_inputs, print_style="full", print_keys=None, show_field=None
+):
+    """print the entries matching search_inputs in several output directories
+
+    The directories are queried in parallel and the entries are named
+    <prefix>/<fileroot>.
+    """
+    from .federated import find_federated_entries
+
+    with span("search.fetch", prefixes=len(prefixes)):
+        entries = find_federated_entries(prefixes, search_inputs)
+
+    if print_style in STREAM_STYLES:
+        if print_keys is None and print_style != "ndjson":
+            with span("search.keys"):
+                print_keys = order_input_keys(
+                    {key for entry in entries for key in entry.inputs}
+                )
+        with span("print", style=print_style):
+            print_stream(entries, print_style, print_keys, show_field)
+        return
+
+    with span("print", style=print_style):
+        print_db_results(
+            [(entry.name, entry.inputs, entry.extra_fields) for entry in entries],
+            print_style=print_style,
+            print_keys=print_keys,
+            show_field=show_field,
+        )
+
+
+def print_stream(entries, print_style, print_keys=None, show_fields=None):
+    show_fields = show_fields or []
+    if print_style == "ndjson":
+        print_ndjson(entries, print_keys, show_fields)
+    elif print_style == "csv":
+        print_csv(entries, print_keys, show_fields)
+    else:
+        print_table(entries, print_keys, show_fields)
+
+
+def format_cell(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def iter_cells(entries, input_keys, show_fields, missing):
+    for entry in entries:
+        inputs = entry.inputs
+        extra_fields = entry.extra_fields if show_fields else {}
+        yield (
+            [entry.name]
+            + [format_cell(inputs[k]) if k in inputs else missing for k in input_keys]
+            + [
+                format_cell(extra_fields[f]) if f in extra_fields else missing
+                for f in show_fields
+            ]
+        )
+
+
+def print_ndjson(entries, print_keys, show_fields):
+    write = sys.stdout.write
+    for entry in entries:
+        if print_keys is None:
+            # the stored inputs are already JSON, so they are passed through as is
+            inputs_json = entry.inputs_json
+        else:
+            inputs_json = json.dumps(
+                {k: v for k, v in entry.inputs.items() if k in print_keys}
+            )
+
+        line = f'{{"filename": {json.dumps(entry.name)}, "inputs": {inputs_json}'
+        for field in show_fields:
+            if field in entry.extra_fields:
+                line += (
+                    f", {json.dumps(field)}: {json.dumps(entry.extra_fields[field])}"
+                )
+        write(line + "}\n")
+
+
+def print_csv(entries, input_keys, show_fields):
+    writer = csv.writer(sys.stdout, lineterminator="\n")
+    writer.writerow(["filename", *input_keys, *show_fields])
+    writer.writerows(iter_cells(entries, input_keys, show_fields, missing=""))
+
+
+def print_table(entries, input_keys, show_fields):
+    header = ["filename", *input_keys, *show_fields]
+    rows = iter_cells(entries, input_keys, show_fields, missing="-")
+
+    # column widths are taken from the first rows only, so memory stays bounded
+    buffered = list(itertools.islice(rows, TABLE_BUFFER_ROWS))
+    widths = [
+        max([len(name)] + [len(row[i]) for row in buffered])
+        for i, name in enumerate(header)
+    ]
+
+    def format_row(cells):
+        return "   ".join(cell.ljust(width) for cell, width in zip(cells, widths))
+
+    write = sys.stdout.write
+    write(format_row(header).rstrip() + "\n")
+    write("-" * (sum(widths) + 3 * (len(widths) - 1)) + "\n")
+    for row in itertools.chain(buffered, rows):
+        write(format_row(row).rstrip() + "\n")
 
 
 def print_entry(prefix, filename, print_style="full", show_field=None):
     if not check_output_dir(prefix):
         return
 
+    # a path below the output directory, e.g. ab/cd/run1_info.npz, names its run
+    filename = os.path.basename(filename)
+    filename = info_fileroot(filename) or filename
+
     db_path = os.path.join(prefix, "dbtools.db")
     conn = get_db_connection(db_path)
     cursor = conn.cursor()
 
     cursor.execute(
-        "SELECT inputs, extra_fields FROM output_files WHERE filename = ?", (filename,)
+        "SELECT inputs, extra_fields, rel_dir FROM output_files WHERE filename = ?",
+        (filename,),
     )
     result = cursor.fetchone()
     conn.close()
 
-    if result:
+    if result and print_style in STREAM_STYLES:
+        entry = SearchResult(filename, *result[:2])
+        print_keys = None if print_style == "ndjson" else list(entry.inputs)
+        print_stream([entry], print_style, print_keys, show_field)
+    elif result:
         inputs = json.loads(result[0])
         extra_field = json.loads(result[1]) if result[1] else {}
         print(
             format_entry(
                 0,
-                filename,
+                join_rel(result[2], filename),
                 inputs,
                 print_style,
                 extra_field=extra_field,
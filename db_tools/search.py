@@ -1,6 +1,9 @@
 import json
+import os
+from functools import cached_property
 
 from .config import load_input_keys
+from .utils import canonical_input_value
 
 
 def get_search_keywords(args):
@@ -12,31 +15,155 @@ def get_search_keywords(args):
     }
 
 
-def find_filenames_by_subset_inputs(search_inputs, db_connection):
+def value_condition(alias, value, typestr):
+    from .filters import Range, OneOf, Approx
+
+    if isinstance(value, (Range, Approx)):
+        conditions = [f"{alias}.num_value IS NOT NULL"]
+        params = []
+        low, high = value.bounds()
+        if low is not None:
+            conditions.append(f"{alias}.num_value >= ?")
+            params.append(canonical_input_value(low, "float")[0])
+        if high is not None:
+            conditions.append(f"{alias}.num_value <= ?")
+            params.append(canonical_input_value(high, "float")[0])
+        return " AND ".join(conditions), params
+
+    if isinstance(value, OneOf):
+        canonical = [canonical_input_value(v, typestr) for v in value.values]
+        conditions = []
+        params = []
+        for i, column in enumerate(["num_value", "str_value"]):
+            values = sorted({pair[i] for pair in canonical if pair[i] is not None})
+            if values:
+                placeholders = ", ".join("?" * len(values))
+                conditions.append(f"{alias}.{column} IN ({placeholders})")
+                params.extend(values)
+        if not conditions:
+            return "0", []
+        return "(" + " OR ".join(conditions) + ")", params
+
+    num_value, str_value = canonical_input_value(value, typestr)
+    if num_value is not None:
+        return f"{alias}.num_value = ?", [num_value]
+    return f"{alias}.str_value = ?", [str_value]
+
+
+def build_search_query(search_inputs, columns="o.filename, o.inputs, o.extra_fields"):
+    input_types = load_input_keys()
+
+    joins = []
+    params = []
+    for i, (key, value) in enumerate(search_inputs.items()):
+        alias = f"v{i}"
+        condition, condition_params = value_condition(
+            alias, value, input_types.get(key)
+        )
+        joins.append(
+            f"JOIN input_values {alias} ON {alias}.filename_id = o.id"
+            f" AND {alias}.key = ? AND {condition}"
+        )
+        params.append(key)
+        params.extend(condition_params)
+
+    query = f"SELECT {columns} FROM output_files o"
+    if joins:
+        query += " " + " ".join(joins)
+    query += " ORDER BY o.id"
+
+    return query, params
+
+
+class SearchResult:
+    """a matching database row whose inputs and extra fields are decoded on first access"""
+
+    def __init__(self, fileroot, inputs_json, extra_fields_json, prefix=None):
+        self.fileroot = fileroot
+        self.inputs_json = inputs_json
+        self.extra_fields_json = extra_fields_json
+        # set for results of a search over several output directories
+        self.prefix = prefix
+
+    @property
+    def name(self):
+        """the fileroot, tagged as <prefix>/<fileroot> if the prefix is set"""
+        if self.prefix is None:
+            return self.fileroot
+        return os.path.join(self.prefix, self.fileroot)
+
+    @cached_property
+    def inputs(self):
+        return json.loads(self.inputs_json)
+
+    @cached_property
+    def extra_fields(self):
+        return json.loads(self.extra_fields_json) if self.extra_fields_json else {}
+
+    def __repr__(self):
+        return f"SearchResult({self.name!r})"
+
+
+def iter_matching_entries(search_inputs, db_connection):
     cursor = db_connection.cursor()
 
-    query = "SELECT filename, inputs, extra_fields FROM output_files"
-    conditions = []
-    params = []
+    query, params = build_search_query(search_inputs)
+    cursor.execute(query, params)
+
+    for filename, inputs_json, extra_fields_json in cursor:
+        yield SearchResult(filename, inputs_json, extra_fields_json)
 
-    for key, value in search_inputs.items():
-        conditions.append(f"json_extract(inputs, '$.{key}') = ?")
-        params.append(value)
 
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
+def find_fileroots(search_inputs, db_connection):
+    cursor = db_connection.cursor()
 
+    query, params = build_search_query(search_inputs, columns="o.filename")
     cursor.execute(query, params)
-    results = cursor.fetchall()
 
-    matching_entries = []
-    for filename, inputs_json, extra_fields_json in results:
-        inputs = json.loads(inputs_json)
-        extra_fields = json.loads(extra_fields_json) if extra_fields_json else {}
-        if all(item in inputs.items() for item in search_inputs.items()):
-            matching_entries.append((filename, inputs, extra_fields))
+    return [filename for filename, in cursor]
+
+
+def find_input_keys(search_inputs, db_connection):
+    cursor = db_connection.cursor()
+
+    query, params = build_search_query(search_inputs, columns="o.id")
+    cursor.execute(
+        f"SELECT DISTINCT key FROM input_values WHERE filename_id IN ({query})", params
+    )
+    return order_input_keys({key for key, in cursor})
 
-    return matching_entries
+
+def order_input_keys(keys):
+    """keys in the order of the input keys config, followed by unknown keys sorted"""
+    input_types = load_input_keys()
+    return [key for key in input_types if key in keys] + sorted(keys - set(input_types))
+
+
+def find_differing_keys(search_inputs, db_connection):
+    cursor = db_connection.cursor()
+
+    # a key differs if it takes several values or is missing from some entries
+    query, params = build_search_query(search_inputs, columns="o.id")
+    cursor.execute(
+        f"""
+        WITH matches AS ({query})
+        SELECT key FROM input_values
+        WHERE filename_id IN (SELECT id FROM matches)
+        GROUP BY key
+        HAVING COUNT(DISTINCT COALESCE(num_value, str_value)) > 1
+            OR COUNT(*) < (SELECT COUNT(*) FROM matches)
+        """,
+        params,
+    )
+
+    return {key for key, in cursor}
+
+
+def find_filenames_by_subset_inputs(search_inputs, db_connection):
+    return [
+        (entry.fileroot, entry.inputs, entry.extra_fields)
+        for entry in iter_matching_entries(search_inputs, db_connection)
+    ]
 
 
 def get_differing_keys(entries):
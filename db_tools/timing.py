@@ -0,0 +1,186 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Timings:
+    """wall time, self time (without nested phases), call count and bytes per phase"""
+
+    def __init__(self):
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds, self_seconds=None, nbytes=0, calls=1):
+        if self_seconds is None:
+            self_seconds = seconds
+        with self.lock:
+            phase = self.phases.setdefault(
+                name, {"calls": 0, "seconds": 0.0, "self_seconds": 0.0, "bytes": 0}
+            )
+            phase["calls"] += calls
+            phase["seconds"] += seconds
+            phase["self_seconds"] += self_seconds
+            phase["bytes"] += nbytes
+
+    def add_span(self, record):
+        self.add(
+            record["name"],
+            record["duration"],
+            record["self_duration"],
+            record["bytes"],
+            record["calls"],
+        )
+
+    def clear(self):
+        with self.lock:
+            self.phases.clear()
+
+    def as_dict(self):
+        with self.lock:
+            return {name: dict(phase) for name, phase in self.phases.items()}
+
+    def summary(self):
+        lines = [
+            f"{'phase':<24} {'calls':>8} {'total [s]':>10} {'self [s]':>10} {'bytes':>12}"
+        ]
+        for name, phase in sorted(self.as_dict().items()):
+            lines.append(
+                f"{name:<24} {phase['calls']:>8} {phase['seconds']:>10.4f} "
+                f"{phase['self_seconds']:>10.4f} {phase['bytes']:>12}"
+            )
+        return "\n".join(lines)
+
+
+TIMINGS = Timings()
+
+_hooks = []
+_local = threading.local()
+_trace_lock = threading.Lock()
+
+
+def add_hook(hook):
+    """call hook(record) with the record dict of every finished span, from any thread"""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+@contextmanager
+def collect():
+    """collect the phases of all spans finished inside the block into a new Timings"""
+    timings = Timings()
+    add_hook(timings.add_span)
+    try:
+        yield timings
+    finally:
+        remove_hook(timings.add_span)
+
+
+def write_trace(record):
+    """append record as a JSON line to $DBTOOLS_TRACE ('1' or '-' writes to stderr)"""
+    target = os.environ.get("DBTOOLS_TRACE")
+    if not target:
+        return
+
+    line = json.dumps(record, default=str) + "\n"
+    with _trace_lock:
+        if target in ("1", "-"):
+            sys.stderr.write(line)
+        else:
+            with open(target, "a") as f:
+                f.write(line)
+
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.bytes = 0
+        self.calls = 1
+        self.child_seconds = 0.0
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def finish(name, start, duration, child_seconds=0.0, nbytes=0, calls=1, attrs=None):
+    stack = _stack()
+    if stack:
+        stack[-1].child_seconds += duration
+
+    record = {
+        "name": name,
+        "parent": stack[-1].name if stack else None,
+        "start": start,
+        "duration": duration,
+        "self_duration": duration - child_seconds,
+        "calls": calls,
+        "bytes": nbytes,
+        "pid": os.getpid(),
+        "thread": threading.get_ident(),
+        "attrs": attrs or {},
+    }
+    TIMINGS.add_span(record)
+    write_trace(record)
+    for hook in list(_hooks):
+        hook(record)
+
+
+@contextmanager
+def span(name, **attrs):
+    """time the block as phase `name`; the yielded Span takes .bytes and .attrs"""
+    current = Span(name, attrs)
+    stack = _stack()
+    start = time.time()
+    t0 = time.perf_counter()
+    stack.append(current)
+    try:
+        yield current
+    finally:
+        stack.pop()
+        finish(
+            name,
+            start,
+            time.perf_counter() - t0,
+            current.child_seconds,
+            current.bytes,
+            current.calls,
+            current.attrs,
+        )
+
+
+def timed_iter(iterable, name, size=None):
+    """yield from iterable, recording the time spent waiting for items as one span
+
+    The time is counted as a nested phase of the span that is active while
+    iterating, so work done between items is not attributed to `name`.
+    """
+    start = time.time()
+    seconds = 0.0
+    calls = 0
+    nbytes = 0
+    iterator = iter(iterable)
+    try:
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                seconds += time.perf_counter() - t0
+                return
+            seconds += time.perf_counter() - t0
+            calls += 1
+            if size is not None:
+                nbytes += size(item)
+            yield item
+    finally:
+        finish(name, start, seconds, nbytes=nbytes, calls=calls)
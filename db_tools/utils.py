@@ -1,4 +1,6 @@
 import argparse
+import json
+import numbers
 import os
 
 
@@ -16,6 +18,71 @@ def str2bool(val):
 TYPE_MAP = {"str": str, "int": int, "float": float, "bool": str2bool}
 
 
+def canonical_input_value(value, typestr=None):
+    """return the (num_value, str_value) pair under which an input value is indexed
+
+    Numbers are compared as floats, so 1 == 1.0 and 0.01 == 1e-2. Values of keys
+    typed in dbtools.inputs.json are converted to that type first; unknown keys
+    are classified by their Python type.
+    """
+    if typestr in ("int", "float"):
+        try:
+            return float(value), None
+        except (TypeError, ValueError):
+            pass
+    elif typestr == "bool":
+        try:
+            return (
+                float(str2bool(value) if isinstance(value, str) else bool(value)),
+                None,
+            )
+        except argparse.ArgumentTypeError:
+            pass
+    elif typestr == "str" and isinstance(value, str):
+        return None, value
+
+    if isinstance(value, numbers.Real):
+        return float(value), None
+    if isinstance(value, str):
+        return None, value
+    return None, json.dumps(value, sort_keys=True, default=str)
+
+
+def filter_type(cast):
+    """argparse type accepting `a:b` ranges, `a,b,c` sets and `~a` / `a~tol` tolerances"""
+
+    def parse(text):
+        # imported here, so building the parser does not import dataclasses
+        from .filters import Range, OneOf, Approx
+
+        if "~" in text:
+            value, tol = text.split("~", 1)
+            if not value:
+                return Approx(cast(tol))
+            return Approx(cast(value), abs_tol=float(tol))
+        if ":" in text:
+            low, high = text.split(":", 1)
+            return Range(cast(low) if low else None, cast(high) if high else None)
+        if "," in text:
+            return OneOf(*(cast(value) for value in text.split(",")))
+        return cast(text)
+
+    parse.__name__ = cast.__name__
+    return parse
+
+
+def split_tolerance_args(argv, keys):
+    """rewrite `-key~value` into `-key ~value`, which argparse cannot split itself"""
+    ret = []
+    for arg in argv:
+        name, sep, value = arg.partition("~")
+        if sep and name.startswith("-") and name[1:] in keys:
+            ret.extend([name, sep + value])
+        else:
+            ret.append(arg)
+    return ret
+
+
 def check_output_dir(prefix):
     output_dir = f"{prefix}/"
     if not os.path.isdir(output_dir):
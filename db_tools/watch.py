@@ -0,0 +1,148 @@
+import os
+import select
+import struct
+import time
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+HEARTBEAT_NAME = "dbtools.watch"
+HEARTBEAT_INTERVAL = 5.0
+
+OVERFLOW = object()
+
+
+class Inotify:
+    """minimal ctypes wrapper around the Linux inotify API for a single directory"""
+
+    def __init__(self, path, mask=WATCH_MASK):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, os.strerror(errno), path)
+
+    def read_events(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        buffer = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_debounced_changes(inotify, is_relevant, debounce=1.0, max_delay=None):
+    """yield sets of changed file names once no new event arrived for `debounce` seconds
+
+    A batch is flushed after at most `max_delay` seconds even if events keep
+    arriving. OVERFLOW is yielded when the kernel dropped events, and None at
+    least every HEARTBEAT_INTERVAL seconds otherwise. The generator stops when
+    the watched directory itself is removed or moved.
+    """
+    if max_delay is None:
+        max_delay = 10 * debounce
+
+    changed = set()
+    first_event = last_event = None
+    last_yield = time.monotonic()
+
+    while True:
+        now = time.monotonic()
+        timeout = last_yield + HEARTBEAT_INTERVAL - now
+        if changed:
+            deadline = min(last_event + debounce, first_event + max_delay)
+            timeout = min(timeout, deadline - now)
+
+        events = inotify.read_events(max(0.0, timeout))
+        now = time.monotonic()
+
+        for mask, name in events:
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if changed:
+                    yield changed
+                return
+            if mask & IN_Q_OVERFLOW:
+                changed = set()
+                first_event = last_event = None
+                last_yield = now
+                yield OVERFLOW
+            elif is_relevant(name):
+                changed.add(name)
+                if first_event is None:
+                    first_event = now
+                last_event = now
+
+        if changed and now >= min(last_event + debounce, first_event + max_delay):
+            last_yield = now
+            yield changed
+            changed = set()
+            first_event = last_event = None
+        elif now - last_yield >= HEARTBEAT_INTERVAL:
+            last_yield = now
+            yield None
+
+
+def touch_heartbeat(prefix):
+    path = os.path.join(prefix, HEARTBEAT_NAME)
+    with open(path, "w") as f:
+        f.write(f"{os.getpid()}\n")
+
+
+def remove_heartbeat(prefix):
+    try:
+        os.remove(os.path.join(prefix, HEARTBEAT_NAME))
+    except FileNotFoundError:
+        pass
+
+
+def watcher_is_alive(prefix):
+    try:
+        mtime = os.path.getmtime(os.path.join(prefix, HEARTBEAT_NAME))
+    except OSError:
+        return False
+    return time.time() - mtime < 3 * HEARTBEAT_INTERVAL
@@ -0,0 +1,169 @@
+from tests.utils import make_info_npz
+from db_tools import DBTools
+
+
+def test_iter_search_decodes_lazily(tmp_path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+
+    make_info_npz(output_dir, "run1", {"omega": 0.057, "E0": 0.01})
+    make_info_npz(output_dir, "run2", {"omega": 0.057, "E0": 0.02})
+    make_info_npz(output_dir, "run3", {"omega": 0.06, "E0": 0.01})
+
+    dbtools = DBTools().with_prefix(str(output_dir))
+    entries = list(dbtools.iter_search(omega=0.057))
+
+    assert sorted(entry.fileroot for entry in entries) == ["run1", "run2"]
+    assert all("inputs" not in vars(entry) for entry in entries)
+
+    inputs = {entry.fileroot: entry.inputs for entry in entries}
+    assert inputs["run2"] == {"omega": 0.057, "E0": 0.02}
+    assert entries[0].extra_fields == {}
+
+
+def test_session_reuses_connection(tmp_path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+
+    make_info_npz(output_dir, "run1", {"omega": 0.057, "E0": 0.01})
+    make_info_npz(output_dir, "run2", {"omega": 0.057, "E0": 0.02})
+
+    with DBTools().with_prefix(str(output_dir)).session() as db:
+        assert sorted(db.search(omega=0.057).fileroots) == ["run1", "run2"]
+        assert db.search(E0=0.02).fileroots == ["run2"]
+        assert db.get_inputs("run1") == ({"omega": 0.057, "E0": 0.01}, {})
+
+        inputs = db.get_inputs_many(["run2", "run1", "missing"])
+        assert list(inputs) == ["run2", "run1", "missing"]
+        assert inputs["run2"][0] == {"omega": 0.057, "E0": 0.02}
+        assert inputs["missing"] == (None, None)
+
+
+def test_search_results_are_cached_until_database_changes(tmp_path, monkeypatch):
+    import db_tools.api
+    from db_tools.db import get_db_connection, BatchWriter
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    make_info_npz(output_dir, "run1", {"omega": 0.057})
+
+    calls = []
+    find_fileroots = db_tools.api.find_fileroots
+
+    def counting_find_fileroots(*args):
+        calls.append(args)
+        return find_fileroots(*args)
+
+    monkeypatch.setattr(db_tools.api, "find_fileroots", counting_find_fileroots)
+
+    dbtools = DBTools().with_prefix(str(output_dir))
+    assert dbtools.search(omega=0.057).fileroots == ["run1"]
+    assert dbtools.search(update=False, omega=0.057).fileroots == ["run1"]
+    assert len(calls) == 1
+
+    conn = get_db_connection(str(output_dir / "dbtools.db"))
+    with BatchWriter(conn) as writer:
+        writer.add("run2", {"omega": 0.057}, None, 1.0)
+    conn.close()
+
+    assert dbtools.search(update=False, omega=0.057).fileroots == ["run1", "run2"]
+    assert len(calls) == 2
+
+
+def test_searches_are_cached(tmp_path, monkeypatch):
+    import db_tools.api
+    from db_tools.main import update
+    from db_tools.db import get_db_connection
+    from db_tools.cache import (
+        database_version,
+        _version_connections,
+        MAX_VERSION_CONNECTIONS,
+    )
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    make_info_npz(output_dir, "run1", {"omega": 0.057})
+    make_info_npz(output_dir, "run2", {"omega": 0.06})
+    update(str(output_dir))
+
+    calls = []
+    find_fileroots = db_tools.api.find_fileroots
+
+    def counting_find_fileroots(*args):
+        calls.append(args)
+        return find_fileroots(*args)
+
+    monkeypatch.setattr(db_tools.api, "find_fileroots", counting_find_fileroots)
+
+    dbtools = DBTools().with_prefix(str(output_dir))
+    for _ in range(2):
+        assert dbtools.search(update=False, omega=0.057).fileroots == ["run1"]
+    assert len(calls) == 1
+
+    # the connections reading the database versions are bounded
+    for i in range(MAX_VERSION_CONNECTIONS + 4):
+        db_path = str(tmp_path / f"db{i}.db")
+        get_db_connection(db_path).close()
+        database_version(db_path)
+    assert len(_version_connections) == MAX_VERSION_CONNECTIONS
+
+
+def test_timings(tmp_path, monkeypatch):
+    import json
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    make_info_npz(output_dir, "run1", {"omega": 0.057, "E0": 0.01})
+    make_info_npz(output_dir, "run2", {"omega": 0.06, "E0": 0.01})
+
+    trace_path = tmp_path / "trace.jsonl"
+    monkeypatch.setenv("DBTOOLS_TRACE", str(trace_path))
+
+    dbtools = DBTools().with_prefix(str(output_dir))
+    with dbtools.timings() as timings:
+        assert dbtools.search(omega=0.057).fileroots == ["run1"]
+
+    phases = timings.as_dict()
+    assert phases["api.search"]["calls"] == 1
+    assert phases["update.parse"]["calls"] == 2
+    assert phases["update.parse"]["bytes"] > 0
+    assert phases["update.write"]["calls"] == 1
+    assert phases["update"]["self_seconds"] <= phases["update"]["seconds"]
+
+    records = [json.loads(line) for line in trace_path.read_text().splitlines()]
+    assert {"api.search", "auto_update", "update.scan"} <= {r["name"] for r in records}
+    assert next(r for r in records if r["name"] == "update.scan")["parent"] == "update"
+
+
+def test_search_multiple_prefixes(tmp_path):
+    import pytest
+
+    for node, omega in [("node1", 0.057), ("node2", 0.06)]:
+        output_dir = tmp_path / node
+        output_dir.mkdir()
+        make_info_npz(output_dir, "run1", {"omega": omega, "E0": 0.01})
+        make_info_npz(output_dir, "run2", {"omega": omega, "E0": 0.02})
+
+    dbtools = DBTools().with_prefix([str(tmp_path / "node*")])
+    assert dbtools.prefix == [str(tmp_path / "node1"), str(tmp_path / "node2")]
+
+    fileroots = dbtools.search(E0=0.01).fileroots
+    assert fileroots == [
+        str(tmp_path / "node1" / "run1"),
+        str(tmp_path / "node2" / "run1"),
+    ]
+
+    entries = list(dbtools.iter_search(omega=0.06))
+    assert sorted((entry.prefix, entry.fileroot) for entry in entries) == [
+        (str(tmp_path / "node2"), "run1"),
+        (str(tmp_path / "node2"), "run2"),
+    ]
+
+    assert dbtools.get_inputs(fileroots[1]) == ({"omega": 0.06, "E0": 0.01}, {})
+    inputs = dbtools.get_inputs_many(fileroots[::-1])
+    assert list(inputs) == fileroots[::-1]
+    assert inputs[fileroots[0]][0] == {"omega": 0.057, "E0": 0.01}
+
+    with pytest.raises(ValueError):
+        with dbtools.session():
+            pass
@@ -0,0 +1,173 @@
+import copy
+import pickle
+import numpy as np
+
+from db_tools.backends import DBGridTDHF
+
+
+def make_grid_tdhf_run(output_dir, fileroot, inputs, n_samples=10):
+    np.savez(
+        output_dir / f"{fileroot}_info.npz", inputs=inputs, metadata={"version": 1}
+    )
+    time_points = np.linspace(0, 1, n_samples)
+    np.savez(
+        output_dir / f"{fileroot}_samples.npz",
+        time_points=time_points,
+        expec_z=np.exp(1j * time_points)[:, None],
+    )
+    np.savez_compressed(
+        output_dir / f"{fileroot}_state.npz", u=np.ones((1, 2, 3), dtype=complex)
+    )
+
+
+def test_load_is_lazy_and_memory_mapped(tmp_path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    make_grid_tdhf_run(output_dir, "run1", {"N": 60, "dt": 0.1})
+    np.save(output_dir / "run1_state.wf.npy", np.arange(6.0).reshape(2, 3))
+
+    results = DBGridTDHF().with_prefix(str(output_dir)).search(N=60).load()
+
+    assert len(results.samples._values) == 0
+    assert isinstance(results.samples.expec_z, np.memmap)
+    assert np.allclose(
+        results.samples.expec_z[:, 0], np.exp(1j * np.linspace(0, 1, 10))
+    )
+    assert set(results.samples._values) == {"expec_z"}
+
+    assert results.info.inputs == {"N": 60, "dt": 0.1}
+    assert results.info.metadata == {"version": 1}
+
+    assert not isinstance(results.state.u, np.memmap)
+    assert results.state.u.shape == (1, 2, 3)
+    assert isinstance(results.state.wf, np.memmap)
+    assert results.state.wf[1, 2] == 5.0
+    assert set(results.state) == {"u"}
+
+
+def test_load_without_state(tmp_path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    make_grid_tdhf_run(output_dir, "run1", {"N": 60})
+
+    results = DBGridTDHF().with_prefix(str(output_dir)).search().load(load_state=False)
+
+    assert results.state is None
+    assert len(results.samples.time_points) == 10
+
+
+def test_load_many(tmp_path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    make_grid_tdhf_run(output_dir, "run1", {"N": 48, "dt": 0.1}, n_samples=5)
+    make_grid_tdhf_run(output_dir, "run2", {"N": 54, "dt": 0.1}, n_samples=8)
+    make_grid_tdhf_run(output_dir, "run3", {"N": 60, "dt": 0.2}, n_samples=8)
+
+    dbtools = DBGridTDHF().with_prefix(str(output_dir)).search(dt=0.1)
+
+    results = dbtools.load_many(fields=["time_points"])
+    assert sorted(results) == ["run1", "run2"]
+    assert len(results["run1"].samples.time_points) == 5
+    assert "expec_z" not in results["run1"].samples
+    assert results["run2"].info.inputs["N"] == 54
+
+    from db_tools.backends.arrays import ARRAY_CACHE
+
+    ARRAY_CACHE.clear()
+    stacked = dbtools.with_fileroots(["run1", "run2"]).load_many(stack=True)
+    assert not ARRAY_CACHE.entries
+    assert stacked.fileroots == ["run1", "run2"]
+    assert stacked.expec_z.shape == (2, 8, 1)
+    assert stacked.masks.expec_z.sum(axis=1).tolist() == [5, 8]
+    assert np.isnan(stacked.time_points[0, 5:]).all()
+    assert np.allclose(stacked.time_points[1], np.linspace(0, 1, 8))
+
+    for copied in [pickle.loads(pickle.dumps(stacked)), copy.deepcopy(stacked)]:
+        assert copied.fileroots == ["run1", "run2"]
+        assert np.array_equal(copied.masks.expec_z, stacked.masks.expec_z)
+        assert not hasattr(copied, "missing")
+
+
+def test_array_cache(tmp_path):
+    from db_tools.backends.arrays import ARRAY_CACHE, configure_array_cache
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    make_grid_tdhf_run(output_dir, "run1", {"N": 60})
+    dbtools = DBGridTDHF().with_prefix(str(output_dir)).search()
+
+    ARRAY_CACHE.clear()
+    configure_array_cache(cache_dir=str(tmp_path / "cache"))
+    try:
+        u = dbtools.load().state.u
+        assert not u.flags.writeable
+        assert np.shares_memory(dbtools.load().state.u, u)
+        assert ARRAY_CACHE.nbytes == u.nbytes
+        assert len(list((tmp_path / "cache").glob("*.npy"))) == 1
+
+        # decompressed members are memory-mapped from the cache directory
+        ARRAY_CACHE.clear()
+        assert isinstance(dbtools.load().state.u, np.memmap)
+
+        # a rewritten file is never served from the cache
+        np.savez_compressed(
+            output_dir / "run1_state.npz", u=np.zeros((1, 2, 3), dtype=complex)
+        )
+        assert np.all(dbtools.load().state.u == 0)
+
+        # memory maps are not cached, so they do not keep their files open
+        configure_array_cache(cache_dir="")
+        ARRAY_CACHE.clear()
+        samples = dbtools.load().samples
+        assert isinstance(samples.time_points, np.memmap)
+        assert not ARRAY_CACHE.entries
+
+        # the number of cached arrays is bounded
+        configure_array_cache(max_entries=1)
+        ARRAY_CACHE.clear()
+        samples = dbtools.load(mmap=False).samples
+        samples.time_points, samples.expec_z
+        assert len(ARRAY_CACHE.entries) == 1
+
+        # arrays that are not cached belong to the caller
+
+        configure_array_cache(max_bytes=0)
+        assert not ARRAY_CACHE.entries
+        u = dbtools.with_fileroots(dbtools.fileroots).load().state.u
+        assert u.flags.writeable
+        assert not ARRAY_CACHE.entries
+    finally:
+        configure_array_cache(max_bytes=512 * 2**20, cache_dir="", max_entries=1024)
+        ARRAY_CACHE.clear()
+
+
+def test_pack(tmp_path):
+    from db_tools.main import update, pack
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    make_grid_tdhf_run(output_dir, "run1", {"N": 48, "dt": 0.1}, n_samples=5)
+    make_grid_tdhf_run(output_dir, "run2", {"N": 54, "dt": 0.1}, n_samples=8)
+    update(str(output_dir))
+    pack(str(output_dir))
+
+    dbtools = DBGridTDHF().with_prefix(str(output_dir)).search(dt=0.1)
+    results = dbtools.load_many(fields=["expec_z"])
+    expec_z = results["run2"].samples.expec_z
+    assert isinstance(expec_z, np.memmap)
+    assert expec_z.shape == (8, 1)
+    assert np.allclose(expec_z[:, 0], np.exp(1j * np.linspace(0, 1, 8)))
+
+    stacked = dbtools.with_fileroots(["run1", "run2"]).load_many(stack=True)
+    assert stacked.masks.time_points.sum(axis=1).tolist() == [5, 8]
+
+    # a run rewritten after packing is read from its npz file until it is repacked
+    make_grid_tdhf_run(output_dir, "run1", {"N": 48, "dt": 0.1}, n_samples=3)
+    results = dbtools.load_many(fields=["time_points"])
+    assert len(results["run1"].samples.time_points) == 3
+    assert not isinstance(results["run1"].samples.time_points, np.memmap)
+
+    pack(str(output_dir))
+    results = dbtools.load_many(fields=["time_points"])
+    assert isinstance(results["run1"].samples.time_points, np.memmap)
+    assert len(results["run1"].samples.time_points) == 3
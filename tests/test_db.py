@@ -0,0 +1,83 @@
+import os
+
+from db_tools.db import (
+    get_db_connection,
+    create_table_if_not_exists,
+    BatchWriter,
+    prune_missing_entries,
+)
+
+
+def fetch_filenames(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT filename FROM output_files ORDER BY filename")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def test_batch_writer_commits_whole_batches_only(tmp_path):
+    db_path = os.path.join(tmp_path, "dbtools.db")
+    conn = get_db_connection(db_path)
+    create_table_if_not_exists(conn)
+
+    try:
+        with BatchWriter(conn, batch_size=2) as writer:
+            writer.add("run1", {"dt": 0.1}, None, 1.0)
+            writer.add("run2", {"dt": 0.2}, None, 1.0)
+            writer.add("run3", {"dt": 0.3}, None, 1.0)
+            raise KeyboardInterrupt
+    except KeyboardInterrupt:
+        pass
+
+    conn.close()
+
+    conn = get_db_connection(db_path)
+    assert fetch_filenames(conn) == ["run1", "run2"]
+    conn.close()
+
+
+def test_prune_missing_entries(tmp_path):
+    conn = get_db_connection(os.path.join(tmp_path, "dbtools.db"))
+    create_table_if_not_exists(conn)
+
+    with BatchWriter(conn) as writer:
+        for name in ["run1", "run2", "run3"]:
+            writer.add(name, {"dt": 0.1}, None, 1.0)
+
+    missing = prune_missing_entries(conn, {"run2"})
+
+    assert sorted(missing) == ["run1", "run3"]
+    assert fetch_filenames(conn) == ["run2"]
+    conn.close()
+
+
+def test_legacy_database_is_migrated(tmp_path):
+    import json
+    import sqlite3
+    from db_tools.search import find_filenames_by_subset_inputs
+
+    db_path = os.path.join(tmp_path, "dbtools.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE output_files (id INTEGER PRIMARY KEY, filename TEXT NOT NULL UNIQUE, inputs TEXT NOT NULL, mtime REAL)"
+    )
+    conn.execute(
+        "INSERT INTO output_files (filename, inputs, mtime) VALUES (?, ?, ?)",
+        ("run1", json.dumps({"omega": 0.057, "N": 60}), 1.0),
+    )
+    conn.commit()
+    conn.close()
+
+    conn = get_db_connection(db_path)
+    results = find_filenames_by_subset_inputs({"N": 60.0, "omega": 0.057}, conn)
+    assert [filename for filename, _, _ in results] == ["run1"]
+
+    with BatchWriter(conn) as writer:
+        writer.add("run1", {"omega": 0.057, "N": 54}, None, 2.0)
+    assert find_filenames_by_subset_inputs({"N": 60}, conn) == []
+
+    conn.execute("DELETE FROM output_files")
+    conn.commit()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM input_values")
+    assert cursor.fetchone()[0] == 0
+    conn.close()
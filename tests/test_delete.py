@@ -44,3 +44,78 @@ def test_delete(tmp_path):
     cursor.execute("SELECT * FROM output_files WHERE filename = ?", (fileroot,))
     assert cursor.fetchone() is None
     conn.close()
+
+
+def test_delete_by_filters_and_stdin(tmp_path):
+    from tests.utils import make_info_npz
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    prefix = str(output_dir)
+
+    make_info_npz(output_dir, "run1", {"omega": 0.057, "dt": 0.05})
+    make_info_npz(output_dir, "run10", {"omega": 0.057, "dt": 0.1})
+    make_info_npz(output_dir, "run2", {"omega": 0.1, "dt": 0.05})
+    make_info_npz(output_dir, "run3", {"omega": 0.2, "dt": 0.05})
+    np.save(output_dir / "run1_samples.npy", np.arange(3))
+
+    subprocess.run(
+        ["dbtools", "delete", "--prefix", prefix, "-dt", "0.05", "-omega", "0:0.15"],
+        input="yes\n",
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # run1 must not take run10 with it
+    def run_files():
+        return sorted(f for f in os.listdir(output_dir) if f.startswith("run"))
+
+    assert run_files() == ["run10_info.npz", "run3_info.npz"]
+
+    subprocess.run(
+        ["dbtools", "delete", "--prefix", prefix, "--force", "-"],
+        input="run10\nrun3\n",
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert run_files() == []
+    conn = get_db_connection(os.path.join(prefix, "dbtools.db"))
+    assert conn.execute("SELECT COUNT(*) FROM output_files").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM scan_files").fetchone()[0] == 0
+    conn.close()
+
+
+def test_delete_keeps_runs_with_longer_fileroots(tmp_path):
+    from tests.utils import make_info_npz
+    from db_tools.main import delete, update
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    prefix = str(output_dir)
+
+    make_info_npz(output_dir, "run", {"omega": 0.057})
+    make_info_npz(output_dir, "run_2", {"omega": 0.1})
+    np.save(output_dir / "run_samples.npy", np.arange(3))
+    np.save(output_dir / "run_2_samples.npy", np.arange(3))
+    make_info_npz(output_dir, "run_3", {"omega": 0.2})
+    np.save(output_dir / "run_3_samples.npy", np.arange(3))
+    update(prefix)
+    # run_3 is only known from the database now
+    os.remove(output_dir / "run_3_info.npz")
+
+    # force is still the third positional parameter
+    delete(prefix, "run", True)
+
+    assert sorted(f for f in os.listdir(output_dir) if f.startswith("run")) == [
+        "run_2_info.npz",
+        "run_2_samples.npy",
+        "run_3_samples.npy",
+    ]
+    conn = get_db_connection(os.path.join(prefix, "dbtools.db"))
+    cursor = conn.cursor()
+    cursor.execute("SELECT filename FROM output_files ORDER BY filename")
+    assert cursor.fetchall() == [("run_2",), ("run_3",)]
+    conn.close()
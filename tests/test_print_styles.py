@@ -0,0 +1,45 @@
+import csv
+import io
+import json
+import subprocess
+from tests.utils import make_info_npz
+
+
+def run_search(output_dir, *args):
+    result = subprocess.run(
+        ["dbtools", "search", "--prefix", str(output_dir), *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout
+
+
+def test_machine_readable_print_styles(tmp_path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+
+    make_info_npz(output_dir, "run1", {"omega": 0.057, "E0": 0.01, "dt": 0.05})
+    make_info_npz(output_dir, "run2", {"omega": 0.057, "E0": 0.02})
+    make_info_npz(output_dir, "run3", {"omega": 0.06, "E0": 0.03})
+
+    lines = run_search(output_dir, "-omega", "0.057", "--print-style=ndjson")
+    records = {r["filename"]: r["inputs"] for r in map(json.loads, lines.splitlines())}
+    assert records == {
+        "run1": {"omega": 0.057, "E0": 0.01, "dt": 0.05},
+        "run2": {"omega": 0.057, "E0": 0.02},
+    }
+
+    rows = list(
+        csv.DictReader(io.StringIO(run_search(output_dir, "--print-style=csv")))
+    )
+    assert {row["filename"]: row["E0"] for row in rows} == {
+        "run1": "0.01",
+        "run2": "0.02",
+        "run3": "0.03",
+    }
+    assert {row["filename"]: row["dt"] for row in rows}["run2"] == ""
+
+    table = run_search(output_dir, "-E0", "0.03", "--print-style=table").splitlines()
+    assert table[0].split() == ["filename", "E0", "omega"]
+    assert table[2].split() == ["run3", "0.03", "0.06"]
@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import subprocess
+import threading
+
+import pytest
+
+from tests.utils import make_info_npz, extract_filenames
+from db_tools import DBTools
+from db_tools.db import get_db_connection, retry_on_busy
+
+
+def test_register(tmp_path, monkeypatch):
+    import db_tools.main
+
+    output_dir = tmp_path / "output"
+    (output_dir / "ab").mkdir(parents=True)
+    prefix = str(output_dir)
+
+    make_info_npz(output_dir, "run1", {"omega": 0.057})
+    make_info_npz(output_dir / "ab", "run2", {"omega": 0.06})
+
+    subprocess.run(
+        [
+            "dbtools",
+            "register",
+            "--prefix",
+            prefix,
+            "--wal",
+            "run1",
+            str(output_dir / "ab" / "run2_info.npz"),
+        ],
+        check=True,
+    )
+
+    result = subprocess.run(
+        ["dbtools", "search", "--prefix", prefix, "--no-update"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert sorted(extract_filenames(result.stdout)) == ["run1", "run2"]
+
+    conn = get_db_connection(os.path.join(prefix, "dbtools.db"))
+    cursor = conn.cursor()
+    assert cursor.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    cursor.execute("SELECT file FROM scan_files ORDER BY file")
+    assert [row[0] for row in cursor.fetchall()] == [
+        "ab/run2_info.npz",
+        "run1_info.npz",
+    ]
+    conn.close()
+
+    # the registered fingerprints let a fast update skip parsing the runs again
+    parsed_paths = []
+    iter_parsed_info_files = db_tools.main.iter_parsed_info_files
+
+    def recording_iter_parsed_info_files(file_paths, jobs=1, **kwargs):
+        parsed_paths.extend(file_paths)
+        return iter_parsed_info_files(file_paths, jobs, **kwargs)
+
+    monkeypatch.setattr(
+        db_tools.main, "iter_parsed_info_files", recording_iter_parsed_info_files
+    )
+    db_tools.main.update(prefix, fast=True)
+    assert parsed_paths == []
+
+    result = subprocess.run(
+        ["dbtools", "register", "--prefix", prefix, "missing"],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 1
+    assert "Failed to register missing" in result.stdout
+
+
+def test_concurrent_registration(tmp_path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    for i in range(16):
+        make_info_npz(output_dir, f"run{i}", {"omega": 0.01 * i})
+
+    dbtools = DBTools().with_prefix(str(output_dir))
+    dbtools.register("run0")
+
+    threads = [
+        threading.Thread(target=dbtools.register, args=(f"run{i}",))
+        for i in range(1, 16)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(dbtools.search(update=False).fileroots) == 16
+
+    with pytest.raises(FileNotFoundError):
+        dbtools.register("missing")
+
+
+def test_retry_on_busy(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    calls = []
+
+    def busy_twice():
+        calls.append(None)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        return "done"
+
+    assert retry_on_busy(busy_twice) == "done"
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(sqlite3.OperationalError):
+        retry_on_busy(busy_twice, retries=1)
+    assert len(calls) == 2
+
+    def broken():
+        raise sqlite3.OperationalError("no such table: output_files")
+
+    with pytest.raises(sqlite3.OperationalError, match="no such table"):
+        retry_on_busy(broken)
+
+
+def test_register_keeps_fast_updates_cheap(tmp_path, monkeypatch):
+    import db_tools.main
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    prefix = str(output_dir)
+    make_info_npz(output_dir, "run1", {"omega": 0.057})
+
+    DBTools().with_prefix(prefix).register("run1")
+    conn = get_db_connection(os.path.join(prefix, "dbtools.db"))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal"
+    conn.close()
+
+    # settle the directory mtimes, so a fast update can skip the unchanged tree
+    db_tools.main.update(prefix)
+    os.utime(output_dir, (1e9, 1e9))
+    db_tools.main.update(prefix, fast=True)
+
+    scans = []
+    scan_tree = db_tools.main.scan_tree
+
+    def recording_scan_tree(*args, **kwargs):
+        scans.append(args)
+        return scan_tree(*args, **kwargs)
+
+    monkeypatch.setattr(db_tools.main, "scan_tree", recording_scan_tree)
+    for _ in range(2):
+        DBTools().with_prefix(prefix).search()
+    assert scans == []
@@ -68,3 +68,156 @@ def test_search_diff(tmp_path):
             assert False, f"Could not parse JSON block: {block}"
 
     assert all_keys == {"E0"}
+
+
+def test_search_canonical_values(tmp_path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+
+    make_info_npz(output_dir, "run1", {"N": 60.0, "E0": 1e-2, "gauge": "length"})
+    make_info_npz(output_dir, "run2", {"N": 60, "E0": "0.01", "gauge": "velocity"})
+    make_info_npz(output_dir, "run3", {"N": 54, "E0": 0.01, "gauge": "length"})
+
+    result = subprocess.run(
+        ["dbtools", "search", "--prefix", str(output_dir), "-N", "60", "-E0", "0.01"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert set(extract_filenames(result.stdout)) == {"run1", "run2"}
+
+    result = subprocess.run(
+        ["dbtools", "search", "--prefix", str(output_dir), "-gauge", "length"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert set(extract_filenames(result.stdout)) == {"run1", "run3"}
+
+
+def test_search_range_set_and_tolerance(tmp_path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+
+    make_info_npz(output_dir, "run1", {"N": 48, "omega": 0.05, "dt": 0.1})
+    make_info_npz(output_dir, "run2", {"N": 54, "omega": 0.055, "dt": 0.1 + 1e-12})
+    make_info_npz(output_dir, "run3", {"N": 60, "omega": 0.06, "dt": 0.2})
+    make_info_npz(output_dir, "run4", {"N": 66, "omega": 0.07, "dt": 0.1})
+
+    def search(*filters):
+        result = subprocess.run(
+            ["dbtools", "search", "--prefix", str(output_dir), *filters],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return set(extract_filenames(result.stdout))
+
+    assert search("-omega", "0.05:0.06") == {"run1", "run2", "run3"}
+    assert search("-omega", "0.055:") == {"run2", "run3", "run4"}
+    assert search("-N", "48,60,66") == {"run1", "run3", "run4"}
+    assert search("-dt~0.1") == {"run1", "run2", "run4"}
+    assert search("-dt", "0.15~0.06") == {"run1", "run2", "run3", "run4"}
+    assert search("-dt~0.1", "-N", "54,60") == {"run2"}
+
+
+def test_api_filter_objects(tmp_path):
+    from db_tools import DBTools, Range, OneOf, Approx
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+
+    make_info_npz(output_dir, "run1", {"N": 48, "omega": 0.05, "atom": "He"})
+    make_info_npz(output_dir, "run2", {"N": 54, "omega": 0.06, "atom": "Ne"})
+    make_info_npz(output_dir, "run3", {"N": 60, "omega": 0.07, "atom": "Ar"})
+
+    dbtools = DBTools().with_prefix(str(output_dir))
+
+    assert sorted(dbtools.search(omega=Range(0.055, None)).fileroots) == [
+        "run2",
+        "run3",
+    ]
+    assert sorted(dbtools.search(atom=OneOf("He", "Ar")).fileroots) == ["run1", "run3"]
+    assert dbtools.search(omega=Approx(0.06, abs_tol=1e-3)).fileroots == ["run2"]
+    assert dbtools.search(N=OneOf()).fileroots == []
+
+
+def test_find_differing_keys_in_sql(tmp_path):
+    from db_tools.db import get_db_connection, BatchWriter
+    from db_tools.search import find_differing_keys, get_differing_keys
+    from db_tools.search import find_filenames_by_subset_inputs
+
+    conn = get_db_connection(str(tmp_path / "dbtools.db"))
+    with BatchWriter(conn) as writer:
+        writer.add("runA", {"omega": 0.057, "E0": 0.01, "N": 60, "dt": 0.05}, None, 1)
+        writer.add("runB", {"omega": 0.057, "E0": 0.02, "N": 60.0}, None, 1)
+        writer.add("runC", {"omega": 0.057, "E0": 0.03, "N": 60, "dt": 0.05}, None, 1)
+        writer.add("runD", {"omega": 0.06, "E0": 0.03, "N": 54, "dt": 0.05}, None, 1)
+
+    filters = {"omega": 0.057}
+    entries = find_filenames_by_subset_inputs(filters, conn)
+
+    assert find_differing_keys(filters, conn) == {"E0", "dt"}
+    assert find_differing_keys(filters, conn) == get_differing_keys(entries)
+    assert find_differing_keys({"E0": 0.03}, conn) == {"omega", "N"}
+    conn.close()
+
+
+def test_search_multiple_prefixes(tmp_path):
+    for node, inputs in [("node1", {"omega": 0.057}), ("node2", {"omega": 0.06})]:
+        output_dir = tmp_path / node / "output"
+        output_dir.mkdir(parents=True)
+        make_info_npz(output_dir, "run1", {**inputs, "E0": 0.01})
+        make_info_npz(output_dir, "run2", {**inputs, "E0": 0.02})
+    # the same run copied to another directory is only listed once
+    copy_dir = tmp_path / "copy"
+    copy_dir.mkdir()
+    make_info_npz(copy_dir, "run1", {"omega": 0.057, "E0": 0.01})
+
+    prefixes = [str(tmp_path / "node*" / "output"), str(copy_dir)]
+    result = subprocess.run(
+        ["dbtools", "search", "--prefix", *prefixes, "-E0", "0.01"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert extract_filenames(result.stdout) == [
+        str(tmp_path / "node1" / "output" / "run1"),
+        str(tmp_path / "node2" / "output" / "run1"),
+    ]
+
+    result = subprocess.run(
+        ["dbtools", "search", "--prefix", *prefixes, "--print-style", "csv"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    lines = result.stdout.splitlines()
+    assert lines[0] == "filename,E0,omega"
+    assert len(lines) == 5
+
+    result = subprocess.run(
+        ["dbtools", "number", "--prefix", *prefixes, "--no-update"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert "Number of entries in all databases: 5" in result.stdout
+
+
+def test_main_search(tmp_path):
+    from argparse import Namespace
+    from db_tools.main import search, update
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    make_info_npz(output_dir, "run1", {"omega": 0.057, "E0": 0.01})
+    make_info_npz(output_dir, "run2", {"omega": 0.057, "E0": 0.02})
+    update(str(output_dir))
+
+    entries = search(str(output_dir), Namespace(E0=0.02))
+    assert [(fileroot, inputs["E0"]) for fileroot, inputs, _ in entries] == [
+        ("run2", 0.02)
+    ]
@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+
+
+def test_cli_does_not_import_heavy_modules():
+    code = (
+        "import sys, db_tools.main; "
+        "print(sorted(m for m in ('numpy', 'dataclasses', 'concurrent.futures.process') "
+        "if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_config_cache_follows_file_changes(tmp_path, monkeypatch):
+    from db_tools.config import load_input_keys
+
+    monkeypatch.chdir(tmp_path)
+    default_keys = load_input_keys()
+    assert "omega" in default_keys and "tag" not in default_keys
+
+    config_path = tmp_path / "dbtools.inputs.json"
+    config_path.write_text(json.dumps({"tag": "str"}))
+    assert load_input_keys()["tag"] == "str"
+
+    # the cached result is not shared with callers
+    load_input_keys().pop("tag")
+    assert "tag" in load_input_keys()
+
+    config_path.write_text(json.dumps({"tag": "int"}))
+    os.utime(config_path, ns=(0, 1))
+    assert load_input_keys()["tag"] == "int"
+
+    config_path.unlink()
+    assert load_input_keys() == default_keys
@@ -64,3 +64,338 @@ def test_update_with_prune(tmp_path):
     output = result.stdout
     assert "run1" not in output
     assert "run2" in output
+
+
+def test_update_parallel_matches_serial(tmp_path):
+    rows = {}
+    for jobs in ("1", "2"):
+        output_dir = tmp_path / f"output{jobs}"
+        output_dir.mkdir()
+        for i in range(8):
+            make_info_npz(output_dir, f"run{i}", {"N": i, "dt": 0.1 * i})
+        (output_dir / "broken_info.npz").write_bytes(b"not an npz file")
+
+        subprocess.run(
+            ["dbtools", "update", "--prefix", str(output_dir), "--jobs", jobs],
+            check=True,
+        )
+
+        conn = get_db_connection(os.path.join(output_dir, "dbtools.db"))
+        cursor = conn.cursor()
+        cursor.execute("SELECT filename, inputs FROM output_files ORDER BY filename")
+        rows[jobs] = cursor.fetchall()
+        conn.close()
+
+    assert len(rows["1"]) == 8
+    assert rows["1"] == rows["2"]
+
+
+def test_fast_update_uses_manifest(tmp_path, monkeypatch):
+    import db_tools.main
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    prefix = str(output_dir)
+
+    make_info_npz(output_dir, "run1", {"dt": 0.1})
+    make_info_npz(output_dir, "run2", {"dt": 0.2})
+    os.utime(output_dir, (1e9, 1e9))
+
+    parsed_paths = []
+    iter_parsed_info_files = db_tools.main.iter_parsed_info_files
+
+    def recording_iter_parsed_info_files(file_paths, jobs=1, **kwargs):
+        parsed_paths.extend(os.path.basename(path) for path in file_paths)
+        return iter_parsed_info_files(file_paths, jobs, **kwargs)
+
+    monkeypatch.setattr(
+        db_tools.main, "iter_parsed_info_files", recording_iter_parsed_info_files
+    )
+
+    db_tools.main.update(prefix, fast=True)
+    assert sorted(parsed_paths) == ["run1_info.npz", "run2_info.npz"]
+
+    os.utime(output_dir, (1.1e9, 1.1e9))
+    parsed_paths.clear()
+    db_tools.main.update(prefix, fast=True)
+    assert parsed_paths == []
+
+    # the directory mtime is unchanged, so even an in-place rewrite is skipped
+    make_info_npz(output_dir, "run1", {"dt": 0.15})
+    os.utime(output_dir, (1.1e9, 1.1e9))
+    db_tools.main.update(prefix, fast=True)
+    assert parsed_paths == []
+
+    make_info_npz(output_dir, "run3", {"dt": 0.3})
+    os.utime(output_dir, (1.2e9, 1.2e9))
+
+    db_tools.main.update(prefix, fast=True)
+    assert sorted(parsed_paths) == ["run1_info.npz", "run3_info.npz"]
+
+    (output_dir / "run1_info.npz").unlink()
+    os.utime(output_dir, (1.3e9, 1.3e9))
+
+    parsed_paths.clear()
+    db_tools.main.update(prefix, fast=True)
+    assert parsed_paths == []
+
+    conn = get_db_connection(os.path.join(prefix, "dbtools.db"))
+    cursor = conn.cursor()
+    cursor.execute("SELECT filename FROM output_files ORDER BY filename")
+    assert [row[0] for row in cursor.fetchall()] == ["run2", "run3"]
+    conn.close()
+
+
+def test_update_if_stale_single_flight(tmp_path, monkeypatch):
+    import threading
+    import time
+    import db_tools.main
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    prefix = str(output_dir)
+    make_info_npz(output_dir, "run1", {"dt": 0.1})
+
+    calls = []
+    scan_and_update = db_tools.main.scan_and_update
+
+    def slow_scan_and_update(*args, **kwargs):
+        calls.append(args)
+        time.sleep(0.3)
+        return scan_and_update(*args, **kwargs)
+
+    monkeypatch.setattr(db_tools.main, "scan_and_update", slow_scan_and_update)
+
+    barrier = threading.Barrier(4)
+
+    def worker():
+        barrier.wait()
+        db_tools.main.update_if_stale(prefix)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+
+    db_tools.main.update_if_stale(prefix, max_age=60)
+    assert len(calls) == 1
+
+    db_tools.main.update_if_stale(prefix, max_age=0)
+    assert len(calls) == 2
+
+
+def test_update_without_write_access_to_lock(tmp_path, monkeypatch):
+    import db_tools.lock
+    import db_tools.main
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    prefix = str(output_dir)
+    make_info_npz(output_dir, "run1", {"omega": 0.057})
+    db_tools.main.update(prefix)
+
+    open_ = os.open
+
+    def read_only_open(path, flags, *args):
+        if flags & (os.O_WRONLY | os.O_RDWR | os.O_CREAT):
+            raise PermissionError(13, "Permission denied", path)
+        return open_(path, flags, *args)
+
+    def read_only_utime(path, *args, **kwargs):
+        raise PermissionError(13, "Permission denied", path)
+
+    monkeypatch.setattr(db_tools.lock.os, "open", read_only_open)
+    monkeypatch.setattr(db_tools.lock.os, "utime", read_only_utime)
+
+    # the existing lock file is locked through a read-only fd and left as is
+    mtime = os.path.getmtime(output_dir / "dbtools.lock")
+    db_tools.main.update_if_stale(prefix)
+    assert os.path.getmtime(output_dir / "dbtools.lock") == mtime
+
+    # without a lock file, the update runs unlocked
+    os.remove(output_dir / "dbtools.lock")
+    db_tools.main.update_if_stale(prefix)
+    assert not (output_dir / "dbtools.lock").exists()
+
+
+def test_update_extra_fields_policy(tmp_path):
+    import json
+    import db_tools.main
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    prefix = str(output_dir)
+
+    np.savez(
+        output_dir / "run1_info.npz",
+        inputs={"dt": 0.1},
+        n_steps=np.int64(100),
+        energies=np.array([1.0, -2.0, np.nan]),
+        density=np.linspace(0, 1, 1000),
+        metadata={"version": np.float32(1.5), "host": b"node1"},
+        labels=np.array([b"ab", b"cd"]),
+    )
+
+    db_tools.main.update(prefix, inline_max_bytes=64)
+
+    conn = get_db_connection(os.path.join(prefix, "dbtools.db"))
+    extra_fields = json.loads(
+        conn.execute("SELECT extra_fields FROM output_files").fetchone()[0]
+    )
+    conn.close()
+
+    assert extra_fields["n_steps"] == 100
+    assert extra_fields["metadata"] == {"version": 1.5, "host": "node1"}
+    assert extra_fields["labels"] == ["ab", "cd"]
+    assert extra_fields["energies"][:2] == [1.0, -2.0]
+    assert extra_fields["density"] == {
+        "__array__": {
+            "ref": {"file": "run1_info.npz", "member": "density"},
+            "shape": [1000],
+            "dtype": "float64",
+            "min": 0.0,
+            "max": 1.0,
+        }
+    }
+
+
+def test_large_npz_members_are_not_decompressed(tmp_path, monkeypatch):
+    import zipfile
+    from db_tools.io import read_npz_info
+
+    path = tmp_path / "run1_info.npz"
+    np.savez_compressed(path, inputs={"dt": 0.1}, wavefunction=np.ones((512, 512)))
+
+    requested = []
+    read = zipfile.ZipExtFile.read
+
+    def recording_read(self, n=-1):
+        if self.name == "wavefunction.npy":
+            requested.append(n)
+        return read(self, n)
+
+    monkeypatch.setattr(zipfile.ZipExtFile, "read", recording_read)
+
+    inputs, extra_fields, summaries = read_npz_info(str(path))
+    assert inputs == {"dt": 0.1}
+    assert extra_fields == {}
+    assert summaries["wavefunction"]["__array__"]["shape"] == [512, 512]
+    assert -1 not in requested and sum(requested) <= 1024
+
+
+def test_nested_layout(tmp_path, monkeypatch):
+    import db_tools.main
+    from db_tools.backends import DBGridTDHF
+
+    output_dir = tmp_path / "output"
+    (output_dir / "ab" / "cd").mkdir(parents=True)
+    (output_dir / "ef").mkdir()
+    prefix = str(output_dir)
+
+    make_info_npz(output_dir, "run1", {"dt": 0.1})
+    make_info_npz(output_dir / "ab" / "cd", "run2", {"dt": 0.2})
+    make_info_npz(output_dir / "ef", "run3", {"dt": 0.3})
+    np.savez(output_dir / "ab" / "cd" / "run2_samples.npz", x=np.arange(3))
+
+    def settle(mtime):
+        for path in ["", "ab", "ab/cd", "ef"]:
+            os.utime(output_dir / path, (mtime, mtime))
+
+    settle(1e9)
+
+    parsed_paths = []
+    iter_parsed_info_files = db_tools.main.iter_parsed_info_files
+
+    def recording_iter_parsed_info_files(file_paths, jobs=1, **kwargs):
+        parsed_paths.extend(os.path.relpath(path, prefix) for path in file_paths)
+        return iter_parsed_info_files(file_paths, jobs, **kwargs)
+
+    monkeypatch.setattr(
+        db_tools.main, "iter_parsed_info_files", recording_iter_parsed_info_files
+    )
+
+    db_tools.main.update(prefix, fast=True)
+    assert sorted(parsed_paths) == [
+        "ab/cd/run2_info.npz",
+        "ef/run3_info.npz",
+        "run1_info.npz",
+    ]
+
+    conn = get_db_connection(os.path.join(prefix, "dbtools.db"))
+    cursor = conn.cursor()
+    cursor.execute("SELECT filename, rel_dir FROM output_files ORDER BY filename")
+    assert cursor.fetchall() == [("run1", ""), ("run2", "ab/cd"), ("run3", "ef")]
+    conn.close()
+
+    # only the changed shard is listed, and only its new run is parsed
+    parsed_paths.clear()
+    db_tools.main.update(prefix, fast=True)
+    assert parsed_paths == []
+
+    make_info_npz(output_dir / "ab" / "cd", "run4", {"dt": 0.4})
+    (output_dir / "ef" / "run3_info.npz").unlink()
+    settle(1.1e9)
+    db_tools.main.update(prefix, fast=True)
+    assert parsed_paths == ["ab/cd/run4_info.npz"]
+
+    dbtools = DBGridTDHF().with_prefix(prefix)
+    assert sorted(dbtools.search(update=False).fileroots) == ["run1", "run2", "run4"]
+    results = dbtools.search(update=False, dt=0.2).load(load_state=False)
+    assert list(results.samples.x) == [0, 1, 2]
+
+    result = subprocess.run(
+        ["dbtools", "print_entry", "--prefix", prefix, "ab/cd/run2_info.npz"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert "Filename: ab/cd/run2" in result.stdout
+
+    subprocess.run(
+        ["dbtools", "delete", "--prefix", prefix, "--force", "run2"], check=True
+    )
+    assert sorted(os.listdir(output_dir / "ab" / "cd")) == ["run4_info.npz"]
+
+
+def test_fresh_shard_under_settled_parent(tmp_path):
+    import db_tools.main
+
+    output_dir = tmp_path / "output"
+    (output_dir / "ab").mkdir(parents=True)
+    (output_dir / "ef").mkdir()
+    prefix = str(output_dir)
+
+    make_info_npz(output_dir / "ab", "run1", {"dt": 0.1})
+    make_info_npz(output_dir / "ef", "run2", {"dt": 0.2})
+    db_tools.main.update(prefix, fast=True)
+    # creating the database changed the output directory, so settle it again
+    for path in ["", "ab", "ef"]:
+        os.utime(output_dir / path, (1e9, 1e9))
+    db_tools.main.update(prefix, fast=True)
+
+    # ab/ changes right before the scan, so its mtime cannot be recorded
+    make_info_npz(output_dir / "ab", "run3", {"dt": 0.3})
+    db_tools.main.update(prefix, fast=True)
+
+    make_info_npz(output_dir / "ab", "run5", {"dt": 0.5})
+    os.utime(output_dir / "ab", (1.1e9, 1.1e9))
+    db_tools.main.update(prefix, fast=True)
+
+    make_info_npz(output_dir / "ef", "run6", {"dt": 0.6})
+    os.utime(output_dir / "ef", (1.2e9, 1.2e9))
+    db_tools.main.update(prefix, fast=True)
+
+    conn = get_db_connection(os.path.join(prefix, "dbtools.db"))
+    cursor = conn.cursor()
+    cursor.execute("SELECT filename FROM output_files ORDER BY filename")
+    assert [row[0] for row in cursor.fetchall()] == [
+        "run1",
+        "run2",
+        "run3",
+        "run5",
+        "run6",
+    ]
+    conn.close()
@@ -0,0 +1,81 @@
+import os
+import signal
+import subprocess
+import time
+
+from tests.utils import make_info_npz
+from db_tools.main import get_db_connection
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def db_filenames(db_path):
+    conn = get_db_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT filename FROM output_files ORDER BY filename")
+    filenames = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return filenames
+
+
+def test_watch_applies_changes(tmp_path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    db_path = os.path.join(output_dir, "dbtools.db")
+
+    make_info_npz(output_dir, "run1", {"dt": 0.1})
+
+    process = subprocess.Popen(
+        ["dbtools", "watch", "--prefix", str(output_dir), "--debounce", "0.1"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert wait_for(lambda: (output_dir / "dbtools.watch").exists())
+        assert db_filenames(db_path) == ["run1"]
+
+        make_info_npz(output_dir, "run2", {"dt": 0.2})
+        assert wait_for(lambda: db_filenames(db_path) == ["run1", "run2"])
+
+        (output_dir / "run1_info.npz").unlink()
+        assert wait_for(lambda: db_filenames(db_path) == ["run2"])
+    finally:
+        process.send_signal(signal.SIGINT)
+        process.wait(timeout=10)
+
+    assert not (output_dir / "dbtools.watch").exists()
+
+
+def test_watch_rescans_with_its_settings_on_overflow(tmp_path, monkeypatch):
+    import db_tools.main
+    import db_tools.watch
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    make_info_npz(output_dir, "run1", {"dt": 0.1})
+
+    def overflowing_changes(inotify, is_relevant, debounce=1.0, max_delay=None):
+        yield db_tools.watch.OVERFLOW
+
+    monkeypatch.setattr(db_tools.watch, "iter_debounced_changes", overflowing_changes)
+
+    calls = []
+    update = db_tools.main.update
+
+    def recording_update(prefix, **kwargs):
+        calls.append(kwargs)
+        return update(prefix, **kwargs)
+
+    monkeypatch.setattr(db_tools.main, "update", recording_update)
+    db_tools.main.watch(str(output_dir), batch_size=10, wal=True)
+
+    # the initial scan and the rescan after the overflow
+    assert len(calls) == 2
+    assert calls[1]["wal"] and calls[1]["batch_size"] == 10